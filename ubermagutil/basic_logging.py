@@ -1,9 +1,220 @@
 """Setup basic logging for all ubermag packages."""
 
+import atexit
+import contextlib
+import contextvars
+import datetime
+import json
 import logging
+import logging.handlers
+import multiprocessing
+import queue as queue_module
 
+# TODO Each package should use a single logger.
+PACKAGES = [
+    "discretisedfield",
+    "mag2exp",
+    "micromagneticdata",
+    "micromagneticmodel",
+    "micromagnetictests",
+    "mumax3c",
+    "oommfc",
+    "ubermagtable",
+    "ubermagutil",
+]
 
-def setup_logging(level=logging.WARNING, package_levels=None):
+_FORMAT = (
+    "%(asctime)s,%(msecs)d  %(name)s:%(levelname)s"
+    "  [%(pathname)s:%(funcName)s:%(lineno)d] %(message)s"
+)
+_DATEFMT = "%Y-%m-%d:%H:%M:%S"
+
+_listener = None
+_handlers = []  # handlers added to the package loggers and dedicated handlers
+_context = contextvars.ContextVar("ubermagutil_log_context", default=None)
+
+
+class JSONFormatter(logging.Formatter):
+    """Formatter writing each record as one line of JSON.
+
+    Every line contains the time (ISO 8601), level, logger name, message,
+    process id, thread name, and source location of the record, followed by
+    the fields of its ``context`` attribute (see ``log_context``) and the
+    formatted exception if any.
+
+    Examples
+    --------
+    1. Formatting a record.
+
+    >>> import json
+    >>> import logging
+    >>> import ubermagutil.basic_logging as ubl
+    ...
+    >>> record = logging.makeLogRecord({'msg': 'drive %d', 'args': (1,)})
+    >>> record.context = {'runner': 'ExeOOMMFRunner'}
+    >>> entry = json.loads(ubl.JSONFormatter().format(record))
+    >>> entry['message'], entry['runner']
+    ('drive 1', 'ExeOOMMFRunner')
+
+    """
+
+    def format(self, record):
+        entry = {
+            "time": datetime.datetime.fromtimestamp(record.created).isoformat(
+                timespec="milliseconds"
+            ),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "pid": record.process,
+            "thread": record.threadName,
+            "location": f"{record.pathname}:{record.funcName}:{record.lineno}",
+            **getattr(record, "context", {}),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class _ContextFilter(logging.Filter):
+    """Add the static and the current ``log_context`` fields to each record."""
+
+    def __init__(self, context=None):
+        super().__init__()
+        self.context = dict(context or {})
+
+    def filter(self, record):
+        record.context = {**self.context, **(_context.get() or {})}
+        return True
+
+
+@contextlib.contextmanager
+def log_context(**fields):
+    """Context manager adding fields to the context of log records.
+
+    The fields are stored in a context variable, so they apply to records
+    logged in the current thread or ``asyncio`` task. They are written by
+    ``JSONFormatter`` when ``setup_logging`` is used with ``fmt='json'``.
+    ``ubermagutil.progress.summary`` and ``ubermagutil.progress.bar`` set
+    ``package``, ``runner``, and ``run_id``.
+
+    Parameters
+    ----------
+    fields
+
+        JSON serialisable fields.
+
+    Examples
+    --------
+    1. Adding a field to the records of a block.
+
+    >>> import logging
+    >>> import ubermagutil.basic_logging as ubl
+    ...
+    >>> with ubl.log_context(sample='A'):
+    ...     logging.getLogger('ubermagutil').debug('sample A')
+
+    """
+    token = _context.set({**(_context.get() or {}), **fields})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+class _BoundedQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler dropping records instead of blocking if the queue is full.
+
+    The number of dropped records is reported with a warning record as soon as
+    the queue has space again.
+
+    """
+
+    def __init__(self, queue):
+        super().__init__(queue)
+        self.dropped = 0
+
+    def dropped_record(self):
+        """Warning record reporting the number of dropped records."""
+        return logging.makeLogRecord(
+            {
+                "name": __name__,
+                "levelno": logging.WARNING,
+                "levelname": "WARNING",
+                "msg": f"{self.dropped} log records dropped (queue full).",
+            }
+        )
+
+    def enqueue(self, record):
+        try:
+            if self.dropped:
+                self.queue.put_nowait(self.dropped_record())
+                self.dropped = 0
+            self.queue.put_nowait(record)
+        except queue_module.Full:
+            self.dropped += 1
+
+
+class _QueueListener(logging.handlers.QueueListener):
+    def enqueue(self, record):
+        # Wait for space in a full queue while the thread is processing it.
+        while self._thread.is_alive():
+            try:
+                self.queue.put(record, timeout=0.1)
+                return
+            except queue_module.Full:
+                pass
+
+    def enqueue_sentinel(self):
+        self.enqueue(self._sentinel)
+
+
+def _stop_queue_listener():
+    """Process all queued records and remove the handlers of the packages."""
+    global _listener
+    for p in PACKAGES:
+        logger = logging.getLogger(p)
+        for handler in _handlers:
+            logger.removeHandler(handler)
+        logger.propagate = True
+    if _listener is not None:
+        for handler in _handlers:
+            if isinstance(handler, _BoundedQueueHandler) and handler.dropped:
+                _listener.enqueue(handler.dropped_record())
+                handler.dropped = 0
+        _listener.stop()  # processes all records in the queue before returning
+        for handler in _listener.handlers:
+            handler.flush()
+        _listener = None
+    for handler in _handlers:
+        if not isinstance(handler, _BoundedQueueHandler):
+            handler.close()
+    _handlers.clear()
+
+
+atexit.register(_stop_queue_listener)
+
+
+def _add_handler(handler, context):
+    handler.addFilter(_ContextFilter(context))
+    _handlers.append(handler)
+    for p in PACKAGES:
+        logger = logging.getLogger(p)
+        logger.addHandler(handler)
+        logger.propagate = False
+
+
+def setup_logging(
+    level=logging.WARNING,
+    package_levels=None,
+    queue=False,
+    queue_size=10000,
+    fmt="text",
+    filename=None,
+    context=None,
+):
     """Set up basic logging for Ubermag with per-package control.
 
     This function creates a basic logger (printing to stdout) and sets the log
@@ -11,6 +222,26 @@ def setup_logging(level=logging.WARNING, package_levels=None):
     control is possible by passing a dictionary to ``package_levels``. Keys
     must be ubermag subpackages, values log levels.
 
+    With ``fmt='json'`` or ``filename``, records of the packages are written by
+    a dedicated handler (to stderr or appended to ``filename``) instead of the
+    handlers of the root logger. With ``fmt='json'``, each record is written as
+    one line of JSON including the fields of ``context`` and ``log_context``
+    (see ``JSONFormatter``).
+
+    With ``queue=True``, the package loggers do not write records themselves.
+    Instead, records are put in a queue and written in a background thread
+    (``logging.handlers.QueueListener``), so that logging does not block on
+    terminal or file I/O. If the queue holds ``queue_size`` records, further
+    records are dropped (and counted in a warning) instead of blocking. All
+    queued records are written when ``setup_logging`` is called again and at
+    interpreter exit.
+
+    With ``queue='process'``, a ``multiprocessing.Queue`` is used instead, which
+    can be passed to worker processes. Workers calling ``setup_logging`` with
+    this queue forward their records to it, so that the records of all
+    processes are written in the order of arrival by the listener thread of
+    the parent process.
+
     Parameters
     ----------
     level : str, int, logging.LEVEL
@@ -21,6 +252,36 @@ def setup_logging(level=logging.WARNING, package_levels=None):
         as values. It allows fine-grain control over logging for
         individual packages.
 
+    queue : bool, str, queue.Queue, multiprocessing.Queue, optional
+        If ``True`` or ``'process'``, records are written in a background
+        thread. If a queue returned by ``setup_logging`` in the parent process
+        is passed, records are forwarded to it. Defaults to ``False``.
+
+    queue_size : int, optional
+        Maximum number of records in the queue. Defaults to ``10000``.
+
+    fmt : str, optional
+        Format of the records, ``'text'`` or ``'json'``. Defaults to
+        ``'text'``.
+
+    filename : str, optional
+        File the records of the packages are appended to. Defaults to
+        ``None``.
+
+    context : dict, optional
+        Fields added to the context of all records of this process (e.g. a
+        worker id). Defaults to ``None``.
+
+    Returns
+    -------
+    queue.Queue, multiprocessing.Queue, or None
+        Queue of the records if ``queue`` is used.
+
+    Raises
+    ------
+    ValueError
+        If ``fmt`` or ``queue`` are not valid.
+
     Example
     -------
     1. Setting up a basic logger with default log-level ``logging.WARNING``
@@ -33,32 +294,80 @@ def setup_logging(level=logging.WARNING, package_levels=None):
     >>> import ubermagutil
     >>> ubermagutil.setup_logging(package_levels={'oommfc': logging.DEBUG})
 
+    3. Writing records in a background thread
+
+    >>> import ubermagutil
+    >>> _ = ubermagutil.setup_logging(queue=True)
+    >>> ubermagutil.setup_logging()  # write queued records and stop the thread
+
+    4. Collecting JSON records of worker processes in one file
+
+    >>> import concurrent.futures
+    >>> import os
+    >>> import tempfile
+    >>> import ubermagutil
+    ...
+    >>> filename = os.path.join(tempfile.mkdtemp(), 'ubermag.jsonl')
+    >>> records = ubermagutil.setup_logging(
+    ...     logging.INFO, queue='process', fmt='json', filename=filename
+    ... )
+    >>> executor = concurrent.futures.ProcessPoolExecutor(
+    ...     initializer=ubermagutil.setup_logging,
+    ...     initargs=(logging.INFO, None, records),
+    ... )
+    >>> # submit simulations to executor
+    >>> executor.shutdown()
+    >>> ubermagutil.setup_logging()
+
     """
-    # TODO Each package should use a single logger.
-    packages = [
-        "discretisedfield",
-        "mag2exp",
-        "micromagneticdata",
-        "micromagneticmodel",
-        "micromagnetictests",
-        "mumax3c",
-        "oommfc",
-        "ubermagtable",
-        "ubermagutil",
-    ]
+    if fmt not in ("text", "json"):
+        msg = f"Log format {fmt=} is not 'text' or 'json'."
+        raise ValueError(msg)
+    if isinstance(queue, str) and queue != "process":
+        msg = f"Queue {queue=} is not a bool, 'process', or a queue."
+        raise ValueError(msg)
+
+    _stop_queue_listener()
+
+    package_levels = package_levels if package_levels is not None else {}
+
+    for p in PACKAGES:
+        logging.getLogger(p).setLevel(package_levels.get(p, level))
+
+    if not isinstance(queue, (bool, str)):  # worker forwarding to the parent
+        _add_handler(_BoundedQueueHandler(queue), context)
+        return queue
 
     # No change of the global log level to avoid logs from other packages
     # e.g. matplotlib
     # no fixed columns because (name) and (pathname) vary too much
-    logging.basicConfig(
-        format=(
-            "%(asctime)s,%(msecs)d  %(name)s:%(levelname)s"
-            "  [%(pathname)s:%(funcName)s:%(lineno)d] %(message)s"
-        ),
-        datefmt="%Y-%m-%d:%H:%M:%S",
-    )
+    logging.basicConfig(format=_FORMAT, datefmt=_DATEFMT)
 
-    package_levels = package_levels if package_levels is not None else {}
+    if fmt == "json" or filename is not None:
+        if filename is None:
+            handler = logging.StreamHandler()
+        else:
+            handler = logging.FileHandler(filename, encoding="utf-8")
+        if fmt == "json":
+            handler.setFormatter(JSONFormatter())
+        else:
+            handler.setFormatter(logging.Formatter(_FORMAT, _DATEFMT))
+        if not queue:
+            _add_handler(handler, context)
+            return None
+        _handlers.append(handler)  # closed with the listener
+        handlers = [handler]
+    elif not queue:
+        return None
+    else:
+        handlers = logging.getLogger().handlers
 
-    for p in packages:
-        logging.getLogger(p).setLevel(package_levels.get(p, level))
+    global _listener
+    if queue == "process":
+        records = multiprocessing.Queue(maxsize=queue_size)
+    else:
+        records = queue_module.Queue(maxsize=queue_size)
+    _add_handler(_BoundedQueueHandler(records), context)
+    _listener = _QueueListener(records, *handlers, respect_handler_level=True)
+    _listener.start()
+    return records
@@ -0,0 +1,7 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def history(monkeypatch):
+    """Disable the history of runs in doctests, see ``ubermagutil.history``."""
+    monkeypatch.setenv("UBERMAG_HISTORY", "")
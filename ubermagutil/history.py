@@ -0,0 +1,273 @@
+"""Persistent history of run times and prediction of run durations."""
+
+import contextlib
+import datetime
+import json
+import logging
+import os
+import statistics
+
+log = logging.getLogger(__name__)
+
+MAX_RUNS = 50
+MAX_SIZE = 2**18  # bytes, about 1500 runs
+
+
+def history_path():
+    """Path of the JSON lines file storing the run history.
+
+    The path is taken from the environment variable ``UBERMAG_HISTORY``.
+    Setting it to an empty string disables the history. Otherwise,
+    ``ubermag/runs.jsonl`` in ``XDG_CACHE_HOME`` (defaults to ``~/.cache``) is
+    used.
+
+    Returns
+    -------
+    str or None
+
+        Path of the history file or ``None`` if the history is disabled.
+
+    Examples
+    --------
+    1. History file set with ``UBERMAG_HISTORY``.
+
+    >>> import os
+    >>> import ubermagutil.history as uh
+    ...
+    >>> os.environ['UBERMAG_HISTORY'] = 'runs.jsonl'
+    >>> uh.history_path()
+    'runs.jsonl'
+    >>> del os.environ['UBERMAG_HISTORY']
+
+    """
+    path = os.environ.get("UBERMAG_HISTORY")
+    if path is not None:
+        return path or None
+    cache = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(cache, "ubermag", "runs.jsonl")
+
+
+def record(package_name, runner_name, duration, total=None, hints=None, path=None):
+    """Append a finished run to the history.
+
+    Each run is stored as one line of JSON, which is written with a single
+    ``write`` in append mode so that concurrent runs do not interleave. If the
+    file is larger than ``MAX_SIZE`` bytes afterwards, only the latest runs in
+    the last half of it are kept. Failing to write the history (e.g. on a
+    read-only filesystem) is logged and does not raise.
+
+    Parameters
+    ----------
+    package_name : str
+
+        Name of the external simulation package.
+
+    runner_name : str
+
+        Name of the ubermag-internal runner for the external package.
+
+    duration : numbers.Real
+
+        Duration of the run in seconds.
+
+    total : int, optional
+
+        Size of the run, e.g. the number of output files written. Defaults to
+        ``None``.
+
+    hints : dict, optional
+
+        Further JSON serialisable properties of the run (e.g. the number of
+        cells), which must match for a run to be used in ``predict``. Defaults
+        to ``None``.
+
+    path : str, optional
+
+        History file. Defaults to ``history_path()``.
+
+    """
+    path = history_path() if path is None else path
+    if path is None:
+        return
+    entry = {
+        "time": datetime.datetime.now().isoformat(timespec="seconds"),
+        "package": package_name,
+        "runner": runner_name,
+        "total": total,
+        "hints": hints or {},
+        "duration": duration,
+    }
+    try:
+        line = (json.dumps(entry) + "\n").encode()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "ab+") as f:
+            if f.seek(0, os.SEEK_END) > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":  # previous write was interrupted
+                    line = b"\n" + line
+            f.write(line)
+            size = f.tell()
+        if size > MAX_SIZE:
+            _truncate(path)
+    except (OSError, TypeError) as e:
+        log.warning("Cannot record run in history %s: %s", path, e)
+
+
+def _tail(path, size):
+    """Complete lines in the last ``size`` bytes of ``path``."""
+    with open(path, "rb") as f:
+        start = max(f.seek(0, os.SEEK_END) - size, 0)
+        f.seek(start)
+        lines = f.read().splitlines(keepends=True)
+    if start > 0 and lines:
+        lines.pop(0)  # partial line
+    return lines
+
+
+def _truncate(path):
+    """Keep the lines in the last half of ``MAX_SIZE`` bytes of the history."""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            f.writelines(_tail(path, MAX_SIZE // 2))
+        os.replace(tmp, path)  # atomic, readers see the old or the new file
+    finally:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(tmp)
+
+
+def runs(package_name=None, runner_name=None, hints=None, path=None):
+    """Runs recorded in the history, oldest first.
+
+    At most the last ``MAX_SIZE`` bytes of the file are read, so reading takes
+    a bounded time. Malformed lines (e.g. from an interrupted write) are
+    skipped.
+
+    Parameters
+    ----------
+    package_name, runner_name : str, optional
+
+        If given, only runs of this package and runner are returned. Defaults to
+        ``None``.
+
+    hints : dict, optional
+
+        If given, only runs recorded with these hints are returned. Defaults to
+        ``None``.
+
+    path : str, optional
+
+        History file. Defaults to ``history_path()``.
+
+    Returns
+    -------
+    list
+
+        Recorded runs as dictionaries with keys ``time``, ``package``,
+        ``runner``, ``total``, ``hints``, and ``duration``.
+
+    """
+    path = history_path() if path is None else path
+    try:
+        lines = _tail(path, MAX_SIZE)
+    except (OSError, TypeError):
+        return []
+    result = []
+    for line in lines:
+        try:
+            entry = json.loads(line)
+            duration = float(entry["duration"])
+        except (ValueError, TypeError, KeyError):
+            continue
+        if package_name is not None and entry.get("package") != package_name:
+            continue
+        if runner_name is not None and entry.get("runner") != runner_name:
+            continue
+        if hints is not None and entry.get("hints") != hints:
+            continue
+        result.append({**entry, "duration": duration})
+    return result
+
+
+def predict(package_name, runner_name, total=None, hints=None, path=None):
+    """Predict the duration of a run from the history.
+
+    Only the latest ``MAX_RUNS`` runs of the same package and runner (and with
+    the same ``hints`` if given) are used. Without ``total``, the median
+    duration is returned. Otherwise, the duration is fitted as a linear function
+    of ``total`` (fixed overhead and time per item) if runs of at least two
+    different sizes with a positive time per item are available, and scaled
+    with the median time per item otherwise.
+
+    Parameters
+    ----------
+    package_name : str
+
+        Name of the external simulation package.
+
+    runner_name : str
+
+        Name of the ubermag-internal runner for the external package.
+
+    total : int, optional
+
+        Size of the run, e.g. the number of output files written. Defaults to
+        ``None``.
+
+    hints : dict, optional
+
+        Further properties of the run, see ``record``. If ``None``, runs with
+        any hints are used. Defaults to ``None``.
+
+    path : str, optional
+
+        History file. Defaults to ``history_path()``.
+
+    Returns
+    -------
+    float or None
+
+        Predicted duration in seconds or ``None`` if there is no matching run.
+
+    Examples
+    --------
+    1. Predict the duration from recorded runs.
+
+    >>> import os
+    >>> import tempfile
+    >>> import ubermagutil.history as uh
+    ...
+    >>> path = os.path.join(tempfile.mkdtemp(), 'runs.jsonl')
+    >>> uh.predict('pkg', 'runner', total=30, path=path) is None
+    True
+    >>> uh.record('pkg', 'runner', 12, total=10, path=path)
+    >>> uh.record('pkg', 'runner', 22, total=20, path=path)
+    >>> uh.predict('pkg', 'runner', total=30, path=path)
+    32.0
+    >>> uh.predict('pkg', 'runner', path=path)
+    17.0
+
+    """
+    history = runs(package_name, runner_name, hints, path)[-MAX_RUNS:]
+    if not history:
+        return None
+    durations = [entry["duration"] for entry in history]
+    sized = [
+        (entry["total"], entry["duration"])
+        for entry in history
+        if isinstance(entry.get("total"), (int, float)) and entry["total"] > 0
+    ]
+    if total is None or not sized:
+        return statistics.median(durations)
+
+    if len({size for size, _ in sized}) > 1:
+        sizes, times = zip(*sized)
+        mean_size = statistics.fmean(sizes)
+        mean_time = statistics.fmean(times)
+        slope = sum((s - mean_size) * (t - mean_time) for s, t in sized) / sum(
+            (s - mean_size) ** 2 for s in sizes
+        )
+        if slope > 0:
+            return max(mean_time + slope * (total - mean_size), 0.0)
+
+    return statistics.median(t / s for s, t in sized) * total
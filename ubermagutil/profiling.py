@@ -0,0 +1,272 @@
+"""On-demand profiling of Python code with cProfile or a stack sampler."""
+
+import collections
+import contextlib
+import cProfile
+import datetime
+import itertools
+import logging
+import os
+import re
+import signal
+import sys
+import threading
+
+from . import tools
+
+log = logging.getLogger(__name__)
+
+MODES = ("cprofile", "sample")
+
+_counter = itertools.count()  # unique file names within a process
+
+
+class StackSampler:
+    """Sampling profiler collecting Python stacks in collapsed-stack format.
+
+    In the main thread on Unix, the stack is sampled by a ``SIGPROF`` handler
+    every ``interval`` seconds of CPU time. Elsewhere, a background thread
+    samples the stack of the starting thread every ``interval`` seconds of wall
+    time. The overhead is independent of the number of function calls, which
+    makes sampling suitable for long runs.
+
+    Parameters
+    ----------
+    interval : numbers.Real, optional
+
+        Sampling interval in seconds. Defaults to ``0.005``.
+
+    Examples
+    --------
+    1. Sampling a computation.
+
+    >>> import ubermagutil.profiling as up
+    ...
+    >>> sampler = up.StackSampler(interval=0.001)
+    >>> sampler.start()
+    >>> _ = sum(i**2 for i in range(10**6))
+    >>> sampler.stop()
+    >>> sampler.counts  # doctest: +SKIP
+    Counter({'<module> (<doctest ...>:1);<genexpr> (<doctest ...>:1)': 52})
+
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.counts = collections.Counter()
+        self._thread = None
+        self._stop = threading.Event()
+        self._handler = None
+
+    def _add(self, frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            filename = os.path.basename(code.co_filename)
+            stack.append(f"{code.co_name} ({filename}:{code.co_firstlineno})")
+            frame = frame.f_back
+        self.counts[";".join(reversed(stack))] += 1
+
+    def start(self):
+        """Start sampling the current thread."""
+        self._stop.clear()
+        if hasattr(signal, "setitimer") and threading.current_thread() is (
+            threading.main_thread()
+        ):
+            self._handler = signal.signal(
+                signal.SIGPROF, lambda signum, frame: self._add(frame)
+            )
+            signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+        else:
+            ident = threading.get_ident()
+
+            def run():
+                while not self._stop.wait(self.interval):
+                    frame = sys._current_frames().get(ident)
+                    if frame is not None:
+                        self._add(frame)
+
+            self._thread = threading.Thread(target=run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop sampling."""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        else:
+            signal.setitimer(signal.ITIMER_PROF, 0)
+            # None if the previous handler was not installed from Python.
+            signal.signal(signal.SIGPROF, self._handler or signal.SIG_DFL)
+
+    def write(self, path):
+        """Write samples as collapsed stacks (input of ``flamegraph.pl``).
+
+        Parameters
+        ----------
+        path : str, pathlib.Path
+
+            Path of the output file.
+
+        """
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in sorted(self.counts.items()):
+                f.write(f"{stack} {count}\n")
+
+
+def profile_path(package_name, runner_name, mode, directory=None):
+    """Path of the profile of a run.
+
+    The file name consists of the package and runner names (as shown in
+    ``ubermagutil.progress``), the start time, the process id, and a counter
+    of the profiles of the process, so that profiles of repeated or concurrent
+    calls are not overwritten. The extension is ``.prof`` (pstats) for
+    ``'cprofile'`` and ``.folded`` (collapsed stacks) for ``'sample'``.
+
+    Parameters
+    ----------
+    package_name : str
+
+        Name of the external simulation package.
+
+    runner_name : str
+
+        Name of the ubermag-internal runner for the external package.
+
+    mode : str
+
+        Profiling mode, ``'cprofile'`` or ``'sample'``.
+
+    directory : str, pathlib.Path, optional
+
+        Output directory. Defaults to the environment variable
+        ``UBERMAG_PROFILE_DIR`` or the current directory (see
+        ``ubermagutil.tools.resolve_path``).
+
+    Returns
+    -------
+    pathlib.Path
+
+        Path of the profile.
+
+    Examples
+    --------
+    1. Path of a profile.
+
+    >>> import ubermagutil.profiling as up
+    ...
+    >>> up.profile_path('oommf', 'ExeOOMMFRunner', 'cprofile', '/tmp').name
+    'oommf_ExeOOMMFRunner_...T...-...-....prof'
+
+    """
+    if directory is None:
+        directory = os.environ.get("UBERMAG_PROFILE_DIR", ".")
+    now = datetime.datetime.now().strftime("%Y%m%dT%H%M%S")
+    name = re.sub(r"[^\w.-]+", "-", f"{package_name}_{runner_name}")
+    extension = ".prof" if mode == "cprofile" else ".folded"
+    name = f"{name}_{now}-{os.getpid()}-{next(_counter)}{extension}"
+    return tools.resolve_path(directory) / name
+
+
+@contextlib.contextmanager
+def profile(package_name, runner_name, mode=None, directory=None, interval=0.005):
+    """Context manager and decorator profiling the wrapped code.
+
+    Profiling is disabled unless ``mode`` is passed or the environment variable
+    ``UBERMAG_PROFILE`` is set to a mode, so the context can stay in the code.
+    With ``'cprofile'``, every function call is recorded with ``cProfile`` and
+    written in the pstats format (see ``pstats.Stats``). With ``'sample'``, the
+    stack is sampled with ``StackSampler``, which has lower overhead for long
+    runs, and written as collapsed stacks for flame graphs. If another
+    ``cProfile`` profiler is already active, a warning is logged and the code
+    runs without profiling.
+
+    Parameters
+    ----------
+    package_name : str
+
+        Name of the external simulation package.
+
+    runner_name : str
+
+        Name of the ubermag-internal runner for the external package.
+
+    mode : str, optional
+
+        Profiling mode, ``'cprofile'`` or ``'sample'``. Defaults to the
+        environment variable ``UBERMAG_PROFILE``.
+
+    directory : str, pathlib.Path, optional
+
+        Output directory, see ``profile_path``. Defaults to ``None``.
+
+    interval : numbers.Real, optional
+
+        Sampling interval in seconds for ``'sample'``. Defaults to ``0.005``.
+
+    Yields
+    ------
+    pathlib.Path or None
+
+        Path of the profile written at the end, or ``None`` if profiling is
+        disabled.
+
+    Raises
+    ------
+    ValueError
+
+        If ``mode`` is not valid.
+
+    Examples
+    --------
+    1. Profiling a block.
+
+    >>> import pstats
+    >>> import tempfile
+    >>> import ubermagutil.profiling as up
+    ...
+    >>> tmpdir = tempfile.mkdtemp()
+    >>> with up.profile('pkg', 'runner', 'cprofile', tmpdir) as path:
+    ...     _ = sorted(range(1000))
+    >>> stats = pstats.Stats(str(path))
+
+    2. Profiling a function only if ``UBERMAG_PROFILE`` is set.
+
+    >>> @up.profile('pkg', 'runner')
+    ... def run():
+    ...     pass
+    >>> run()
+
+    """
+    mode = os.environ.get("UBERMAG_PROFILE") if mode is None else mode
+    if not mode:
+        yield None
+        return
+    if mode not in MODES:
+        msg = f"Profiling mode {mode=} is not one of {MODES}."
+        raise ValueError(msg)
+
+    path = profile_path(package_name, runner_name, mode, directory)
+    if mode == "cprofile":
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError as e:  # another profiler is active
+            log.warning("Cannot profile %s (%s): %s", package_name, runner_name, e)
+            yield None
+            return
+    else:
+        profiler = StackSampler(interval)
+        profiler.start()
+    try:
+        yield path
+    finally:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if mode == "cprofile":
+            profiler.disable()
+            profiler.dump_stats(path)
+        else:
+            profiler.stop()
+            profiler.write(path)
+        log.info("Profile of %s (%s) written to %s", package_name, runner_name, path)
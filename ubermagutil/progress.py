@@ -1,15 +1,690 @@
+import asyncio
 import contextlib
+import ctypes
+import ctypes.util
 import datetime
+import fnmatch
+import functools
 import glob
+import itertools
+import json
+import logging
+import math
+import os
+import socket
+import struct
+import sys
 import threading
 import time
+import uuid
 
 from tqdm.auto import tqdm
 
+from . import basic_logging as _basic_logging
+from . import history as _history
+from . import resources as _resources
+from . import tracing as _tracing
+
+log = logging.getLogger(__name__)
+
+
+class GlobCounter:
+    """Count files matching ``glob_name`` with ``glob.glob`` on every call.
+
+    Parameters
+    ----------
+    glob_name : str
+
+        Glob pattern of the files to count.
+
+    """
+
+    def __init__(self, glob_name):
+        self.glob_name = glob_name
+
+    def count(self):
+        """Number of matching files."""
+        return len(glob.glob(self.glob_name))
+
+    def close(self):
+        """Release resources (nothing to release)."""
+
+
+class ScandirCounter:
+    """Count files in a single directory, rescanning only if it has changed.
+
+    The directory is only listed again (with ``os.scandir``) if its
+    modification time has changed since the last scan or is so recent that
+    changes within the timestamp resolution could have been missed. The file
+    name pattern must not contain directories with wildcards.
+
+    Parameters
+    ----------
+    glob_name : str
+
+        Glob pattern of the files to count, e.g. ``'drive-0/*.omf'``.
+
+    """
+
+    _RACY_NS = 2_000_000_000  # re-scan if the directory changed less than 2 s ago
+
+    def __init__(self, glob_name):
+        self.dirname, self.pattern = os.path.split(glob_name)
+        self.dirname = self.dirname or os.curdir
+        self._mtime = None
+        self._count = 0
+
+    def _scan(self):
+        try:
+            with os.scandir(self.dirname) as entries:
+                return _match_names((entry.name for entry in entries), self.pattern)
+        except FileNotFoundError:
+            return set()
+
+    def count(self):
+        """Number of matching files."""
+        try:
+            mtime = os.stat(self.dirname).st_mtime_ns
+        except FileNotFoundError:
+            return 0
+        if mtime != self._mtime or time.time_ns() - mtime < self._RACY_NS:
+            self._mtime = mtime
+            self._count = len(self._scan())
+        return self._count
+
+    def close(self):
+        """Release resources (nothing to release)."""
+
+
+class InotifyCounter(ScandirCounter):
+    """Count files in a single directory using Linux inotify events.
+
+    The directory is listed once when the counter is created. Afterwards,
+    creation, deletion, and renaming events of matching files are read from
+    the kernel (via ``ctypes``, without additional dependencies) and the count
+    is updated incrementally. If the kernel event queue overflows, the
+    directory is listed again.
+
+    Parameters
+    ----------
+    glob_name : str
+
+        Glob pattern of the files to count, e.g. ``'drive-0/*.omf'``.
+
+    Raises
+    ------
+    OSError
+
+        If inotify is not available or the directory cannot be watched.
+
+    """
+
+    _IN_MOVED_FROM = 0x40
+    _IN_MOVED_TO = 0x80
+    _IN_CREATE = 0x100
+    _IN_DELETE = 0x200
+    _IN_Q_OVERFLOW = 0x4000
+    _IN_ONLYDIR = 0x1000000
+    _IN_NONBLOCK = 0o4000
+    _IN_CLOEXEC = 0o2000000
+    _EVENT = struct.Struct("iIII")
+
+    def __init__(self, glob_name):
+        super().__init__(glob_name)
+        libc = _libc()
+        self._fd = libc.inotify_init1(self._IN_NONBLOCK | self._IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = (
+            self._IN_CREATE
+            | self._IN_DELETE
+            | self._IN_MOVED_FROM
+            | self._IN_MOVED_TO
+            | self._IN_ONLYDIR
+        )
+        if libc.inotify_add_watch(self._fd, os.fsencode(self.dirname), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(errno, os.strerror(errno), self.dirname)
+        # Watch is active before scanning, so no file can be missed.
+        self._names = self._scan()
+
+    def _read_events(self):
+        while True:
+            try:
+                data = os.read(self._fd, 65536)
+            except BlockingIOError:
+                return
+            offset = 0
+            while offset < len(data):
+                _, mask, _, length = self._EVENT.unpack_from(data, offset)
+                offset += self._EVENT.size
+                name = os.fsdecode(data[offset : offset + length].rstrip(b"\0"))
+                offset += length
+                if mask & self._IN_Q_OVERFLOW:
+                    self._names = self._scan()
+                elif not _match_names([name], self.pattern):
+                    continue
+                elif mask & (self._IN_CREATE | self._IN_MOVED_TO):
+                    self._names.add(name)
+                elif mask & (self._IN_DELETE | self._IN_MOVED_FROM):
+                    self._names.discard(name)
+
+    def count(self):
+        """Number of matching files."""
+        self._read_events()
+        return len(self._names)
+
+    def close(self):
+        """Stop watching the directory."""
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+class HeartbeatCounter:
+    """Read the number of written files from a heartbeat file.
+
+    Instead of listing the output directory, the count is read from a small
+    file (see ``ubermagutil.progress.heartbeat_path``), which is updated by the
+    runner or a wrapper of the simulation with
+    ``ubermagutil.progress.write_heartbeat`` or
+    ``ubermagutil.progress.heartbeat_writer``. Each call to ``count`` does a
+    single ``stat`` and reads the file only if it has changed. This keeps the
+    metadata load on shared or network filesystems (NFS, Lustre) minimal.
+
+    Parameters
+    ----------
+    glob_name : str
+
+        Glob pattern of the files to count, which determines the location of
+        the heartbeat file.
+
+    """
+
+    def __init__(self, glob_name):
+        self.path = heartbeat_path(glob_name)
+        self._stat = None
+        self._count = 0
+
+    def count(self):
+        """Number of written files according to the heartbeat file."""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return self._count
+        if (stat.st_mtime_ns, stat.st_size, stat.st_ino) != self._stat:
+            with open(self.path, encoding="utf-8") as f:
+                content = f.read()
+            with contextlib.suppress(ValueError):
+                self._count = int(content)
+                self._stat = stat.st_mtime_ns, stat.st_size, stat.st_ino
+        return self._count
+
+    def close(self):
+        """Release resources (nothing to release)."""
+
+
+def heartbeat_path(glob_name):
+    """Path of the heartbeat file for ``glob_name``.
+
+    The heartbeat file ``.ubermag-heartbeat`` is located in the directory of
+    ``glob_name``, i.e. there is one heartbeat file per output directory.
+
+    Parameters
+    ----------
+    glob_name : str
+
+        Glob pattern of the output files.
+
+    Returns
+    -------
+    str
+
+        Path of the heartbeat file.
+
+    """
+    return os.path.join(os.path.dirname(glob_name), ".ubermag-heartbeat")
+
+
+def write_heartbeat(glob_name, count):
+    """Atomically write ``count`` to the heartbeat file of ``glob_name``.
+
+    The count is written to a temporary file, which then replaces the heartbeat
+    file, so that readers never see a partially written file.
+
+    Parameters
+    ----------
+    glob_name : str
+
+        Glob pattern of the output files.
+
+    count : int
+
+        Number of written files.
+
+    Examples
+    --------
+    1. Writing and reading the heartbeat.
+
+    >>> import tempfile
+    >>> import ubermagutil as uu
+    ...
+    >>> glob_name = f'{tempfile.mkdtemp()}/*.omf'
+    >>> counter = uu.progress.file_counter(glob_name, backend='heartbeat')
+    >>> counter.count()
+    0
+    >>> uu.progress.write_heartbeat(glob_name, 3)
+    >>> counter.count()
+    3
+
+    """
+    path = heartbeat_path(glob_name)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(str(int(count)))
+    os.replace(tmp, path)
+
+
+@contextlib.contextmanager
+def heartbeat_writer(glob_name, interval=1, backend="auto"):
+    """Context manager keeping the heartbeat file of ``glob_name`` up to date.
+
+    This is a helper for runners which write output files matching
+    ``glob_name`` and should switch to heartbeat-based progress without
+    changing how their output is written. It should run on the node where the
+    simulation runs: a background thread counts the matching files there (see
+    ``ubermagutil.progress.file_counter``) and rewrites the heartbeat file
+    whenever the count changes. Progress is then shown anywhere by passing
+    ``backend='heartbeat'`` to ``ubermagutil.progress.bar``.
+
+    Parameters
+    ----------
+    glob_name : str
+
+        Glob pattern of the output files.
+
+    interval : numbers.Real, optional
+
+        Time in seconds between counts. Defaults to ``1``.
+
+    backend : str, optional
+
+        Backend used for counting files locally. Defaults to ``'auto'``.
+
+    """
+    counter = file_counter(glob_name, backend)
+    terminate = threading.Event()
+
+    def update():
+        count = None
+        while True:
+            stop = terminate.is_set()  # final count after termination
+            new_count = counter.count()
+            if new_count != count:
+                count = new_count
+                write_heartbeat(glob_name, count)
+            if stop:
+                return
+            terminate.wait(interval)
+
+    thread = threading.Thread(target=update, daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        terminate.set()
+        thread.join()
+        counter.close()
+
+
+class StreamCounter:
+    r"""Progress parsed from the output of a running subprocess.
+
+    A background thread reads ``stream`` (e.g. ``process.stdout`` of a
+    ``subprocess.Popen`` with ``stdout=subprocess.PIPE``) line by line. Each
+    line is passed to ``parser`` or matched with the compiled regular
+    expression ``pattern``: if ``pattern`` contains a group, the progress is
+    the integer value of the first group of the last matching line (e.g. an
+    iteration number); otherwise, matching lines are counted. No filesystem
+    access is needed. If ``tee`` is passed, every line is written to it as
+    read, without decoding or copying (e.g. to ``sys.stdout.buffer`` or a log
+    file opened in the mode of ``stream``). Lines which cannot be parsed and
+    failing writes to ``tee`` are logged, and the stream is still read to the
+    end, so that the subprocess never blocks on a full pipe.
+
+    An ``asyncio.StreamReader`` (e.g. ``process.stdout`` of
+    ``asyncio.create_subprocess_exec``) is read by a task on the running event
+    loop instead of a thread, so the counter must be created in a coroutine.
+    Use ``wait`` to wait for the end of the output without blocking the loop.
+
+    Parameters
+    ----------
+    stream : io.IOBase, asyncio.StreamReader
+
+        Binary or text stream to read from.
+
+    pattern : re.Pattern, optional
+
+        Compiled regular expression with the type (``bytes`` or ``str``) of the
+        lines of ``stream``. Defaults to ``None``.
+
+    parser : callable, optional
+
+        Function returning the progress for a line or ``None`` if the line does
+        not contain progress information. Defaults to ``None``.
+
+    tee : io.IOBase, optional
+
+        Stream to which all lines are written. Defaults to ``None``.
+
+    Raises
+    ------
+    ValueError
+
+        If neither or both of ``pattern`` and ``parser`` are passed.
+
+    Examples
+    --------
+    1. Iteration number from the output of a subprocess.
+
+    >>> import re
+    >>> import subprocess
+    >>> import sys
+    >>> import ubermagutil as uu
+    ...
+    >>> code = 'for i in range(1, 6): print(f"iteration {i}")'
+    >>> pattern = re.compile(rb'iteration (\d+)')
+    >>> command = [sys.executable, '-c', code]
+    >>> with subprocess.Popen(command, stdout=subprocess.PIPE) as process:
+    ...     counter = uu.progress.StreamCounter(process.stdout, pattern=pattern)
+    ...     counter.close()  # wait for the end of the output
+    >>> counter.count()
+    5
+
+    """
+
+    def __init__(self, stream, pattern=None, parser=None, tee=None):
+        if (pattern is None) == (parser is None):
+            raise ValueError("Exactly one of pattern and parser is required.")
+        self.stream = stream
+        self.pattern = pattern
+        self.parser = parser
+        self.tee = tee
+        self._count = 0
+        self._errors = 0
+        if isinstance(stream, asyncio.StreamReader):
+            self._thread = None
+            self._task = asyncio.get_running_loop().create_task(self._async_read())
+        else:
+            self._task = None
+            self._thread = threading.Thread(target=self._read, daemon=True)
+            self._thread.start()
+
+    def _parse(self, line):
+        if self.parser is not None:
+            return self.parser(line)
+        match = self.pattern.search(line)
+        if match is None:
+            return None
+        elif self.pattern.groups:
+            return int(match.group(1))
+        else:
+            return self._count + 1
+
+    def _add_line(self, line):
+        if self.tee is not None:
+            try:
+                self.tee.write(line)
+            except (OSError, ValueError) as e:  # ValueError if tee is closed
+                log.warning("Cannot write output to %r: %s", self.tee, e)
+                self.tee = None
+        try:
+            progress = self._parse(line)
+        except Exception as e:
+            # Only the first error is a warning to avoid flooding the log.
+            level = logging.DEBUG if self._errors else logging.WARNING
+            log.log(level, "Cannot parse progress from %r: %r", line, e)
+            self._errors += 1
+            return
+        if progress is not None:
+            self._count = progress
+
+    def _flush_tee(self):
+        if self.tee is not None:
+            with contextlib.suppress(OSError, ValueError):
+                self.tee.flush()
+
+    def _read(self):
+        while line := self.stream.readline():
+            self._add_line(line)
+        self._flush_tee()
+
+    async def _async_read(self):
+        while True:
+            try:
+                line = await self.stream.readline()
+            except ValueError as e:  # line longer than the limit is discarded
+                log.warning("Cannot read line from %r: %s", self.stream, e)
+                continue
+            if not line:
+                break
+            self._add_line(line)
+        self._flush_tee()
+
+    def count(self):
+        """Most recent progress."""
+        return self._count
+
+    def close(self, timeout=None):
+        """Wait until the stream is exhausted (the subprocess has finished).
+
+        Parameters
+        ----------
+        timeout : numbers.Real, optional
+
+            Maximum waiting time in seconds. If the stream is not exhausted
+            after ``timeout``, it is still read to the end in the background.
+            Defaults to ``None`` (no limit).
+
+        Raises
+        ------
+        RuntimeError
+
+            If an ``asyncio.StreamReader`` is read and the stream is not
+            exhausted, because waiting would block the event loop. Use
+            ``wait`` instead.
+
+        """
+        if self._thread is not None:
+            self._thread.join(timeout)
+        elif not self._task.done() and timeout != 0:
+            msg = "Use 'await counter.wait()' to wait for an asyncio stream."
+            raise RuntimeError(msg)
+
+    async def wait(self, timeout=None):
+        """Wait until the stream is exhausted without blocking the event loop.
+
+        Parameters
+        ----------
+        timeout : numbers.Real, optional
+
+            Maximum waiting time in seconds, see ``close``. Defaults to
+            ``None`` (no limit).
+
+        """
+        if self._task is not None:
+            await asyncio.wait({self._task}, timeout=timeout)
+            return
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._thread.is_alive():
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            await asyncio.sleep(0.01)
+
+
+def _match_names(names, pattern):
+    """Names matching ``pattern``, hiding dot-files like ``glob.glob``."""
+    if not pattern.startswith("."):
+        names = (name for name in names if not name.startswith("."))
+    return set(fnmatch.filter(names, pattern))
+
+
+@functools.lru_cache(maxsize=1)
+def _libc():
+    libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    if not hasattr(libc, "inotify_init1"):
+        raise OSError("inotify is not available.")
+    return libc
+
+
+def file_counter(glob_name, backend="auto"):
+    """Create a counter of files matching ``glob_name``.
+
+    With ``backend='auto'``, ``InotifyCounter`` is used on Linux,
+    ``ScandirCounter`` if inotify is not available, and ``GlobCounter`` if the
+    directory part of ``glob_name`` contains wildcards. ``HeartbeatCounter``
+    (``backend='heartbeat'``) is never selected automatically because the
+    heartbeat file must be written by the runner.
+
+    Parameters
+    ----------
+    glob_name : str
+
+        Glob pattern of the files to count.
+
+    backend : str, optional
+
+        One of ``'auto'``, ``'inotify'``, ``'scandir'``, ``'glob'``, or
+        ``'heartbeat'``. Defaults to ``'auto'``.
+
+    Returns
+    -------
+    GlobCounter, ScandirCounter, InotifyCounter, HeartbeatCounter
+
+        File counter with methods ``count`` and ``close``.
+
+    Raises
+    ------
+    ValueError
+
+        If ``backend`` is unknown.
+
+    Examples
+    --------
+    1. Count files.
+
+    >>> import tempfile
+    >>> import ubermagutil as uu
+    ...
+    >>> tmpdir = tempfile.mkdtemp()
+    >>> counter = uu.progress.file_counter(f'{tmpdir}/*.omf')
+    >>> counter.count()
+    0
+    >>> open(f'{tmpdir}/m0.omf', 'w').close()
+    >>> counter.count()
+    1
+    >>> counter.close()
+
+    """
+    backends = {
+        "glob": GlobCounter,
+        "scandir": ScandirCounter,
+        "inotify": InotifyCounter,
+        "heartbeat": HeartbeatCounter,
+    }
+    if backend not in (*backends, "auto"):
+        msg = f"Unknown {backend=}; use 'auto', {', '.join(map(repr, backends))}."
+        raise ValueError(msg)
+    elif backend != "auto":
+        return backends[backend](glob_name)
+
+    if any(char in os.path.dirname(glob_name) for char in "*?["):
+        return GlobCounter(glob_name)
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyCounter(glob_name)
+        except OSError:
+            pass
+    return ScandirCounter(glob_name)
+
+
+class RateEstimator:
+    """Smoothed rate of a growing count and the estimated time to reach a total.
+
+    The rate is an exponential moving average of the rates between consecutive
+    updates, weighted by the time between them with time constant ``tau``, so
+    that irregular update intervals do not bias the estimate. During the first
+    ``tau`` seconds, the average rate since the first update is used instead.
+
+    Parameters
+    ----------
+    total : int, optional
+
+        Total count used for the estimated time of arrival. Defaults to
+        ``None``.
+
+    tau : numbers.Real, optional
+
+        Smoothing time constant in seconds. Defaults to ``10``.
+
+    Examples
+    --------
+    1. Estimate the rate and the remaining time.
+
+    >>> import ubermagutil as uu
+    ...
+    >>> estimator = uu.progress.RateEstimator(total=10)
+    >>> estimator.update(0, timestamp=0)
+    >>> estimator.update(2, timestamp=1)
+    >>> estimator.rate, estimator.eta
+    (2.0, 4.0)
+
+    """
+
+    def __init__(self, total=None, tau=10):
+        self.total = total
+        self.tau = tau
+        self.rate = None
+        self.count = 0
+        self._first = None
+        self._last = None
+
+    def update(self, count, timestamp=None):
+        """Add a new count measured at ``timestamp`` (``time.monotonic()``)."""
+        timestamp = time.monotonic() if timestamp is None else timestamp
+        if self._first is None:
+            self._first = self._last = count, timestamp
+        dt = timestamp - self._last[1]
+        if timestamp - self._first[1] <= self.tau:
+            if timestamp > self._first[1]:
+                self.rate = (count - self._first[0]) / (timestamp - self._first[1])
+        elif dt > 0:
+            rate = (count - self._last[0]) / dt
+            if self.rate is None:  # first two updates more than tau apart
+                self.rate = rate
+            else:
+                self.rate += (1 - math.exp(-dt / self.tau)) * (rate - self.rate)
+        self.count = count
+        self._last = count, timestamp
+
+    @property
+    def eta(self):
+        """Estimated remaining time in seconds or ``None`` if unknown."""
+        if self.total is None or not self.rate or self.rate <= 0:
+            return None
+        return max(self.total - self.count, 0) / self.rate
+
 
 class ProgressBar(threading.Thread):
     """Tqdm progress bar thread for simulation progress.
 
+    The polling interval adapts to the run: it starts at ``INTERVAL``, is
+    halved whenever new files were written, and grows by 50% whenever the
+    count did not change, always within ``min_interval`` and ``max_interval``.
+    The smoothed rate of written files and the estimated remaining time are
+    shown in the bar and available as ``rate`` and ``eta``.
+
     Parameters
     ----------
     total : int
@@ -29,69 +704,869 @@ class ProgressBar(threading.Thread):
         Name of the output files used for globbing in the output directory (including
         parent directories, base directory is drive-XX).
 
+    backend : str, optional
+
+        Backend used for counting files, see ``ubermagutil.progress.file_counter``.
+        Defaults to ``'auto'``.
+
+    min_interval : numbers.Real, optional
+
+        Minimum polling interval in seconds. Defaults to ``INTERVAL`` for
+        counters listing directories (``GlobCounter`` and ``ScandirCounter``),
+        so that frequently written files do not increase the number of
+        listings, and to ``MIN_INTERVAL`` otherwise.
+
+    max_interval : numbers.Real, optional
+
+        Maximum polling interval in seconds. Defaults to ``MAX_INTERVAL``.
+
+    callback : callable, optional
+
+        Function called with the new number of files whenever it changes.
+        Defaults to ``None``.
+
+    disable : bool, optional
+
+        If ``True``, the tqdm bar is not shown. Defaults to ``False``.
+
+    counter : object, optional
+
+        Counter used instead of counting files matching ``glob_name``, e.g.
+        ``ubermagutil.progress.StreamCounter``. It must have the methods
+        ``count`` and ``close``. Defaults to ``None``.
+
+    unit : str, optional
+
+        Description of the counted items shown in the bar. Defaults to
+        ``'files written'``.
+
+    resources : bool, optional
+
+        If ``True``, CPU time, resident memory, and I/O of the process tree are
+        sampled on every update, see ``ubermagutil.resources.ResourceSampler``.
+        Sampling is silently disabled where ``/proc`` is not available.
+        Defaults to ``False``.
+
+    expected_duration : numbers.Real, optional
+
+        Expected duration of the run in seconds, e.g. from
+        ``ubermagutil.history.predict``. It is used for ``eta`` until the rate
+        of written files is known. Defaults to ``None``.
+
     """
 
     INTERVAL = 1
+    MIN_INTERVAL = 0.1
+    MAX_INTERVAL = 10
+    CLOSE_TIMEOUT = 1
 
-    def __init__(self, total, package_name, runner_name, glob_name):
+    def __init__(
+        self,
+        total,
+        package_name,
+        runner_name,
+        glob_name,
+        backend="auto",
+        min_interval=None,
+        max_interval=None,
+        callback=None,
+        disable=False,
+        counter=None,
+        unit="files written",
+        resources=False,
+        expected_duration=None,
+    ):
         super().__init__()
         self.bar = tqdm(
             total=total,
             desc=f"Running {package_name} ({runner_name})",
-            bar_format="{l_bar}{bar}| {n_fmt}/{total_fmt} files written [{elapsed}]",
+            bar_format=(
+                f"{{l_bar}}{{bar}}| {{n_fmt}}/{{total_fmt}} {unit}"
+                " [{elapsed}{postfix}]"
+            ),
+            disable=disable,
         )
-        self._terminate = False
+        self.callback = callback
+        self._rate_unit = unit.split()[0] if unit else "items"
+        self._terminate = threading.Event()
         self.glob_name = glob_name
+        self.counter = file_counter(glob_name, backend) if counter is None else counter
+        if min_interval is None:
+            listing = isinstance(self.counter, (GlobCounter, ScandirCounter))
+            listing = listing and not isinstance(self.counter, InotifyCounter)
+            min_interval = self.INTERVAL if listing else self.MIN_INTERVAL
+        self.min_interval = min_interval
+        self.max_interval = self.MAX_INTERVAL if max_interval is None else max_interval
+        self.interval = min(max(self.INTERVAL, self.min_interval), self.max_interval)
+        self.estimator = RateEstimator(total)
+        self.expected_duration = expected_duration
+        self._start = time.monotonic()
+        self.sampler = None
+        if resources:
+            with contextlib.suppress(OSError):  # no /proc
+                self.sampler = _resources.ResourceSampler()
 
-    def run(self):
-        """Update the progress bar once per second and close when terminating."""
-        while not self._terminate:
-            self.bar.n = len(glob.glob(f"{self.glob_name}"))
-            self.bar.refresh()
-            time.sleep(self.INTERVAL)
-        self.bar.n = len(glob.glob(f"{self.glob_name}"))
+    @property
+    def resource_usage(self):
+        """``ResourceUsage`` of the process tree or ``None`` if not sampled."""
+        return None if self.sampler is None else self.sampler.usage
+
+    @property
+    def rate(self):
+        """Smoothed number of files written per second or ``None`` if unknown."""
+        return self.estimator.rate
+
+    @property
+    def eta(self):
+        """Estimated remaining time in seconds or ``None`` if unknown."""
+        if self.estimator.eta is None and self.expected_duration is not None:
+            return max(self.expected_duration - (time.monotonic() - self._start), 0)
+        return self.estimator.eta
+
+    def _update(self, count=None):
+        count = self.counter.count() if count is None else count
+        if count != self.estimator.count:
+            self.interval = max(self.interval / 2, self.min_interval)
+            if self.callback is not None:
+                self.callback(count)
+        else:
+            self.interval = min(self.interval * 1.5, self.max_interval)
+        self.estimator.update(count)
+        if self.sampler is not None:
+            self.sampler.sample()
+        self.bar.n = count
+        postfix = []
+        if self.rate:
+            postfix.append(f"{self.rate:.3g} {self._rate_unit}/s")
+        if self.eta is not None:
+            postfix.append(f"ETA {tqdm.format_interval(self.eta)}")
+        if postfix:
+            self.bar.set_postfix_str(", ".join(postfix), refresh=False)
         self.bar.refresh()
+
+    def run(self):
+        """Update the progress bar periodically and close when terminating."""
+        while not self._terminate.is_set():
+            self._update()
+            self._terminate.wait(self.interval)
+        self._close()
+
+    def _close(self, timeout=None):
+        """Do the final update and close the counter and the bar."""
+        if isinstance(self.counter, StreamCounter):
+            # The subprocess may still be running if the context was left with
+            # an exception, so only wait a limited time for the end of output.
+            timeout = self.CLOSE_TIMEOUT if timeout is None else timeout
+            self.counter.close(timeout=timeout)
+            self._update()
+        else:
+            self._update()
+            self.counter.close()
         self.bar.close()
 
     def terminate(self):
-        """Stop a running progress bar thread after the current iteration."""
-        self._terminate = True
+        """Stop a running progress bar thread immediately.
+
+        The thread is woken up if it is waiting for the next update, so the
+        final file count is done without waiting for the polling interval.
+
+        """
+        self._terminate.set()
         self.join()
 
 
 @contextlib.contextmanager
-def bar(total, package_name, runner_name, glob_name):
-    progress_bar_thread = ProgressBar(total, package_name, runner_name, glob_name)
-    now = datetime.datetime.now()
-    progress_bar_thread.start()
+def _run_context(package_name, runner_name, **args):
+    """Tracing span and logging context of a run."""
+    span = _tracing.span(f"{package_name} ({runner_name})", **args)
+    context = _basic_logging.log_context(
+        package=package_name, runner=runner_name, run_id=uuid.uuid4().hex
+    )
+    with span, context:
+        yield
+
+
+class ProgressService(threading.Thread):
+    """Single thread polling the progress of many concurrent runs.
+
+    Instead of one ``ProgressBar`` thread per run, runs are registered with
+    one service, which counts the written files of all registered runs in a
+    single background thread. Progress is shown either as one bar per run or,
+    with ``aggregate=True``, as a single bar with the files written by all
+    runs and the number of completed runs. The thread is started when the
+    first run is registered and stopped with ``close``.
+
+    Parameters
+    ----------
+    aggregate : bool, optional
+
+        If ``True``, a single aggregate bar is shown. Defaults to ``False``.
+
+    backend : str, optional
+
+        Backend used for counting files, see ``ubermagutil.progress.file_counter``.
+        Defaults to ``'auto'``.
+
+    Examples
+    --------
+    1. Show one bar for multiple concurrent runs.
+
+    >>> import concurrent.futures
+    >>> import tempfile
+    >>> import ubermagutil as uu
+    ...
+    >>> def run(service, i):
+    ...     tmpdir = tempfile.mkdtemp()
+    ...     with service.bar(1, 'pkg', f'runner {i}', f'{tmpdir}/*.out', quiet=True):
+    ...         open(f'{tmpdir}/m.out', 'w').close()
+    ...
+    >>> service = uu.progress.ProgressService(aggregate=True)
+    >>> with concurrent.futures.ThreadPoolExecutor(4) as executor:
+    ...     _ = list(executor.map(run, [service] * 8, range(8)))
+    >>> service.completed
+    8
+    >>> service.close()
+
+    """
+
+    INTERVAL = 1
+
+    def __init__(self, aggregate=False, backend="auto"):
+        super().__init__(daemon=True)
+        self.aggregate = aggregate
+        self.backend = backend
+        self.completed = 0
+        self._runs = {}
+        self._ids = itertools.count()
+        self._files_completed = 0
+        self._total = 0
+        self._lock = threading.Lock()
+        self._terminate = threading.Event()
+        self.aggregate_bar = None
+        if aggregate:
+            self.aggregate_bar = tqdm(
+                total=0,
+                desc="Running",
+                bar_format=(
+                    "{l_bar}{bar}| {n_fmt}/{total_fmt} files written, {postfix}"
+                    " [{elapsed}]"
+                ),
+                postfix="0/0 runs completed",
+            )
+
+    def register(self, total, package_name, runner_name, glob_name):
+        """Register a run and return its handle for ``unregister``.
+
+        Parameters
+        ----------
+        total : int
+
+            Total number of output files written to disk.
+
+        package_name : str
+
+            Name of the external simulation package.
+
+        runner_name : str
+
+            Name of the ubermag-internal runner for the external package.
+
+        glob_name : str
+
+            Name of the output files used for globbing.
+
+        Returns
+        -------
+        int
+
+            Handle of the run.
+
+        """
+        counter = file_counter(glob_name, self.backend)
+        run_bar = None
+        if not self.aggregate:
+            run_bar = tqdm(
+                total=total,
+                desc=f"Running {package_name} ({runner_name})",
+                bar_format=(
+                    "{l_bar}{bar}| {n_fmt}/{total_fmt} files written [{elapsed}]"
+                ),
+            )
+        with self._lock:
+            handle = next(self._ids)
+            self._runs[handle] = (counter, run_bar)
+            self._total += total
+            if not self.is_alive() and not self._terminate.is_set():
+                self.start()
+        return handle
+
+    def unregister(self, handle):
+        """Do the final count of a run, close its bar, and stop polling it.
+
+        Only the counts of the service are updated; the aggregate bar is redrawn
+        by the polling thread (or by ``close``).
+
+        Parameters
+        ----------
+        handle : int
+
+            Handle returned by ``register``.
+
+        Returns
+        -------
+        int
+
+            Final number of files written by the run.
+
+        """
+        with self._lock:
+            counter, run_bar = self._runs[handle]
+        count = counter.count()  # without the lock, other runs are not blocked
+        with self._lock:
+            del self._runs[handle]
+            self.completed += 1
+            self._files_completed += count
+        counter.close()
+        if run_bar is not None:
+            run_bar.n = count
+            run_bar.close()
+        return count
+
+    def _refresh(self):
+        """Update bars; the lock must be held."""
+        if self.aggregate:
+            self.aggregate_bar.total = self._total
+            self.aggregate_bar.n = self._files_completed + sum(
+                counter.count() for counter, _ in self._runs.values()
+            )
+            n_runs = self.completed + len(self._runs)
+            self.aggregate_bar.set_postfix_str(
+                f"{self.completed}/{n_runs} runs completed", refresh=False
+            )
+            self.aggregate_bar.refresh()
+        else:
+            for counter, run_bar in self._runs.values():
+                run_bar.n = counter.count()
+                run_bar.refresh()
+
+    def run(self):
+        """Update all bars once per interval until ``close`` is called."""
+        while not self._terminate.is_set():
+            with self._lock:
+                self._refresh()
+            self._terminate.wait(self.INTERVAL)
+
+    def close(self):
+        """Stop the polling thread and close the aggregate bar."""
+        self._terminate.set()
+        if self.is_alive():
+            self.join()
+        with self._lock:
+            for handle in list(self._runs):
+                counter, run_bar = self._runs.pop(handle)
+                counter.close()
+                if run_bar is not None:
+                    run_bar.close()
+            if self.aggregate_bar is not None:
+                self._refresh()
+                self.aggregate_bar.close()
+
+    @contextlib.contextmanager
+    def bar(self, total, package_name, runner_name, glob_name, quiet=False):
+        """Context manager registering a run for the duration of the context.
+
+        It is the equivalent of ``ubermagutil.progress.bar`` and prints the same
+        summary line at the end, unless ``quiet=True``.
+
+        """
+        handle = self.register(total, package_name, runner_name, glob_name)
+        now = datetime.datetime.now()
+        with _run_context(package_name, runner_name, total=total):
+            tic = time.time()
+            try:
+                yield
+            finally:
+                toc = time.time()
+                self.unregister(handle)
+                if not quiet:
+                    print(
+                        f"Running {package_name} ({runner_name})"
+                        f"[{now.isoformat(timespec='seconds')}]"
+                        f" took {toc - tic:0.1f} s"
+                    )
+
+
+class EventEmitter:
+    """Emitter of machine-readable progress events.
+
+    Every event is a dictionary with the keys ``event`` (event name) and
+    ``time`` (Unix timestamp), the keyword arguments passed to the emitter
+    (e.g. ``package_name``), and the data passed to ``emit``. It is passed to
+    ``sink``, which can be:
+
+    - a callable, called with the event dictionary,
+
+    - a path (``str`` or ``os.PathLike``), to which events are appended as JSON
+      lines,
+
+    - a ``(host, port)`` tuple, to which a TCP connection is opened and events
+      are sent as JSON lines,
+
+    - an object with a ``sendall`` (socket) or ``write`` (open file) method,
+      which receives JSON lines.
+
+    To limit the number of events, ``'update'`` events are dropped if the
+    previous one was emitted less than ``min_interval`` seconds before, unless
+    ``force=True`` is passed to ``emit``.
+
+    Parameters
+    ----------
+    sink : callable, str, os.PathLike, tuple, socket.socket, io.TextIOBase
+
+        Destination of the events.
+
+    min_interval : numbers.Real, optional
+
+        Minimum time in seconds between ``'update'`` events. Defaults to ``1``.
+
+    context : dict
+
+        Data included in every event, passed as keyword arguments.
+
+    Examples
+    --------
+    1. Collecting events with a callback.
+
+    >>> import ubermagutil as uu
+    ...
+    >>> events = []
+    >>> emitter = uu.progress.EventEmitter(events.append, package_name='pkg')
+    >>> emitter.emit('start', total=10)
+    >>> emitter.emit('update', count=1)
+    >>> emitter.emit('update', count=2)  # dropped (rate limit)
+    >>> [(event['event'], event['package_name']) for event in events]
+    [('start', 'pkg'), ('update', 'pkg')]
+
+    """
+
+    def __init__(self, sink, min_interval=1, **context):
+        self.min_interval = min_interval
+        self.context = context
+        self._lock = threading.Lock()
+        self._last_update = None
+        self._close = None
+        if callable(sink):
+            self._send = sink
+        elif isinstance(sink, (str, os.PathLike)):
+            f = open(sink, "a", encoding="utf-8")  # noqa: SIM115
+            self._send, self._close = self._writer(f), f.close
+        elif isinstance(sink, tuple):
+            connection = socket.create_connection(sink)
+            self._send, self._close = self._sender(connection), connection.close
+        elif hasattr(sink, "sendall"):
+            self._send = self._sender(sink)
+        elif hasattr(sink, "write"):
+            self._send = self._writer(sink)
+        else:
+            raise TypeError(f"Unsupported event sink {type(sink)=}.")
+
+    @staticmethod
+    def _writer(f):
+        def write(event):
+            f.write(json.dumps(event) + "\n")
+            f.flush()
+
+        return write
+
+    @staticmethod
+    def _sender(connection):
+        def send(event):
+            connection.sendall((json.dumps(event) + "\n").encode())
+
+        return send
+
+    def emit(self, event, force=False, **data):
+        """Emit ``event`` with ``data``.
+
+        Parameters
+        ----------
+        event : str
+
+            Name of the event, e.g. ``'start'``, ``'update'``, or ``'finish'``.
+
+        force : bool, optional
+
+            If ``True``, ``'update'`` events are not rate limited. Defaults to
+            ``False``.
+
+        data : dict
+
+            Event data passed as keyword arguments.
+
+        """
+        now = time.monotonic()
+        with self._lock:
+            if event == "update":
+                if (
+                    not force
+                    and self._last_update is not None
+                    and now - self._last_update < self.min_interval
+                ):
+                    return
+                self._last_update = now
+            self._send({"event": event, "time": time.time(), **self.context, **data})
+
+    def close(self):
+        """Close the file or connection opened by the emitter."""
+        if self._close is not None:
+            self._close()
+            self._close = None
+
+
+@contextlib.contextmanager
+def headless(
+    package_name,
+    runner_name,
+    sink,
+    total=None,
+    glob_name=None,
+    min_interval=1,
+    backend="auto",
+):
+    """Context manager emitting progress events instead of printing.
+
+    It replaces ``ubermagutil.progress.bar`` and ``ubermagutil.progress.summary``
+    on machines without a terminal. A ``'start'`` event is emitted on entry and
+    a ``'finish'`` event with the run ``duration`` in seconds (and ``error``
+    if the context is left with an exception) on exit. If ``glob_name`` is
+    passed, written files are counted in a background thread as in
+    ``ubermagutil.progress.bar`` and ``'update'`` events with the ``count`` are
+    emitted, at most once per ``min_interval`` seconds. All events contain
+    ``package_name``, ``runner_name``, and ``total``. See
+    ``ubermagutil.progress.EventEmitter`` for the supported sinks.
+
+    Parameters
+    ----------
+    package_name : str
+
+        Name of the external simulation package.
+
+    runner_name : str
+
+        Name of the ubermag-internal runner for the external package.
+
+    sink : callable, str, os.PathLike, tuple, socket.socket, io.TextIOBase
+
+        Destination of the events.
+
+    total : int, optional
+
+        Total number of output files written to disk. Defaults to ``None``.
+
+    glob_name : str, optional
+
+        Name of the output files used for globbing. Defaults to ``None``.
+
+    min_interval : numbers.Real, optional
+
+        Minimum time in seconds between ``'update'`` events. Defaults to ``1``.
+
+    backend : str, optional
+
+        Backend used for counting files, see ``ubermagutil.progress.file_counter``.
+        Defaults to ``'auto'``.
+
+    Examples
+    --------
+    1. Writing events to a JSON-lines file.
+
+    >>> import json
+    >>> import os
+    >>> import tempfile
+    >>> import ubermagutil as uu
+    ...
+    >>> path = os.path.join(tempfile.mkdtemp(), 'events.jsonl')
+    >>> with uu.progress.headless('pkg', 'runner', path):
+    ...     pass
+    >>> with open(path) as f:
+    ...     [json.loads(line)['event'] for line in f]
+    ['start', 'finish']
+
+    """
+    emitter = EventEmitter(
+        sink,
+        min_interval=min_interval,
+        package_name=package_name,
+        runner_name=runner_name,
+        total=total,
+    )
+    progress_bar_thread = None
+    if glob_name is not None:
+        progress_bar_thread = ProgressBar(
+            total,
+            package_name,
+            runner_name,
+            glob_name,
+            backend,
+            callback=lambda count: emitter.emit("update", count=count),
+            disable=True,
+        )
     tic = time.time()
+    emitter.emit("start")
+    if progress_bar_thread is not None:
+        progress_bar_thread.start()
+    error = None
     try:
         yield
+    except BaseException as e:
+        error = repr(e)
+        raise
     finally:
         toc = time.time()
-        progress_bar_thread.terminate()
-        print(
-            f"Running {package_name} ({runner_name})"
-            f"[{now.isoformat(timespec='seconds')}]"
-            f" took {toc - tic:0.1f} s"
-        )
+        data = {"duration": toc - tic}
+        if progress_bar_thread is not None:
+            progress_bar_thread.terminate()
+            data["count"] = progress_bar_thread.bar.n
+        if error is not None:
+            data["error"] = error
+        emitter.emit("finish", **data)
+        emitter.close()
+
+
+@contextlib.contextmanager
+def bar(
+    total,
+    package_name,
+    runner_name,
+    glob_name,
+    backend="auto",
+    counter=None,
+    unit="files written",
+    resources=False,
+    hints=None,
+    min_interval=None,
+    max_interval=None,
+):
+    progress_bar_thread = ProgressBar(
+        total,
+        package_name,
+        runner_name,
+        glob_name,
+        backend,
+        counter=counter,
+        unit=unit,
+        min_interval=min_interval,
+        max_interval=max_interval,
+        resources=resources,
+        expected_duration=_history.predict(package_name, runner_name, total, hints),
+    )
+    now = datetime.datetime.now()
+    progress_bar_thread.start()
+    with _run_context(package_name, runner_name, total=total):
+        tic = time.time()
+        success = False
+        try:
+            yield progress_bar_thread
+            success = True
+        finally:
+            toc = time.time()
+            progress_bar_thread.terminate()
+            usage = progress_bar_thread.resource_usage
+            print(
+                f"Running {package_name} ({runner_name})"
+                f"[{now.isoformat(timespec='seconds')}]"
+                f" took {toc - tic:0.1f} s" + ("" if usage is None else f" ({usage})")
+            )
+            if success:
+                _history.record(package_name, runner_name, toc - tic, total, hints)
 
 
 @contextlib.contextmanager
-def summary(package_name, runner_name):
+def summary(package_name, runner_name, hints=None, memory=False):
+    """Print a summary line with the duration of the run.
+
+    Parameters
+    ----------
+    package_name : str
+
+        Name of the external simulation package.
+
+    runner_name : str
+
+        Name of the ubermag-internal runner for the external package.
+
+    hints : dict, optional
+
+        Properties of the run stored in the history, see
+        ``ubermagutil.history.record``. Defaults to ``None``.
+
+    memory : bool or dict, optional
+
+        If ``True`` or a dictionary of keyword arguments for
+        ``ubermagutil.resources.memory``, the memory used by the run is
+        measured, appended to the summary line, and yielded as
+        ``ubermagutil.resources.MemoryUsage``. Defaults to ``False``.
+
+    Examples
+    --------
+    1. Summary with memory usage.
+
+    >>> import ubermagutil as uu
+    ...
+    >>> with uu.progress.summary('pkg', 'runner', memory={'nframes': 0}) as usage:
+    ...     pass
+    Running pkg (runner)[...]... (0.0 s, RSS ...)
+
+    """
     now = datetime.datetime.now()
     print(
         f"Running {package_name} ({runner_name})"
         f"[{now.isoformat(timespec='seconds')}]... ",
         end="",
     )
-    tic = time.time()
-    try:
-        yield
-    finally:
-        toc = time.time()
-        seconds = f"({toc - tic:0.1f} s)"
-        print(seconds)  # append seconds to the previous print.
+    if memory:
+        memory_context = _resources.memory(**({} if memory is True else memory))
+    else:
+        memory_context = contextlib.nullcontext()
+    with _run_context(package_name, runner_name):
+        tic = time.time()
+        success = False
+        usage = None
+        try:
+            with memory_context as usage:
+                yield usage
+            success = True
+        finally:
+            toc = time.time()
+            seconds = f"{toc - tic:0.1f} s"
+            if usage is not None and str(usage):
+                seconds += f", {usage}"
+            print(f"({seconds})")  # append seconds to the previous print.
+            if success:
+                _history.record(package_name, runner_name, toc - tic, hints=hints)
+
+
+@contextlib.asynccontextmanager
+async def async_bar(
+    total,
+    package_name,
+    runner_name,
+    glob_name,
+    backend="auto",
+    counter=None,
+    unit="files written",
+    resources=False,
+    hints=None,
+    min_interval=None,
+    max_interval=None,
+):
+    """Asynchronous context manager equivalent of ``ubermagutil.progress.bar``.
+
+    Instead of a dedicated thread per run, the progress bar is updated by a
+    task on the running event loop, with the same adaptive polling interval as
+    ``ubermagutil.progress.ProgressBar``. Files are counted directly on the
+    loop, which is cheap with the default counters (inotify or a directory
+    listing only if the directory has changed), so hundreds of concurrent runs
+    do not need additional threads. A ``StreamCounter`` should read an
+    ``asyncio.StreamReader``; with a ``StreamCounter`` reading a blocking
+    stream, its reader thread is waited for without blocking the loop.
+
+    The context yields the ``ubermagutil.progress.ProgressBar`` holding the
+    state of the bar (e.g. ``rate`` and ``eta``); its thread is never started.
+    ``min_interval`` and ``max_interval`` bound the polling interval as in
+    ``ubermagutil.progress.ProgressBar``.
+
+    Examples
+    --------
+    1. Concurrent runs with ``asyncio``.
+
+    >>> import asyncio
+    >>> import tempfile
+    >>> import ubermagutil as uu
+    ...
+    >>> async def run(i):
+    ...     tmpdir = tempfile.mkdtemp()
+    ...     async with uu.progress.async_bar(1, 'pkg', f'{i}', f'{tmpdir}/*.out'):
+    ...         await asyncio.sleep(0.01)
+    ...
+    >>> async def main():
+    ...     await asyncio.gather(*(run(i) for i in range(3)))
+    ...
+    >>> asyncio.run(main())
+    Running pkg (...)[...] took ... s
+    Running pkg (...)[...] took ... s
+    Running pkg (...)[...] took ... s
+
+    """
+    progress_bar = ProgressBar(
+        total,
+        package_name,
+        runner_name,
+        glob_name,
+        backend,
+        counter=counter,
+        unit=unit,
+        min_interval=min_interval,
+        max_interval=max_interval,
+        resources=resources,
+        expected_duration=_history.predict(package_name, runner_name, total, hints),
+    )
+    terminate = asyncio.Event()
+
+    async def poll():
+        while not terminate.is_set():
+            progress_bar._update()
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(terminate.wait(), progress_bar.interval)
+
+    now = datetime.datetime.now()
+    task = asyncio.create_task(poll())
+    with _run_context(package_name, runner_name, total=total):
+        tic = time.time()
+        success = False
+        try:
+            yield progress_bar
+            success = True
+        finally:
+            toc = time.time()
+            terminate.set()
+            await task
+            if isinstance(progress_bar.counter, StreamCounter):
+                await progress_bar.counter.wait(progress_bar.CLOSE_TIMEOUT)
+            progress_bar._close(timeout=0)
+            usage = progress_bar.resource_usage
+            print(
+                f"Running {package_name} ({runner_name})"
+                f"[{now.isoformat(timespec='seconds')}]"
+                f" took {toc - tic:0.1f} s" + ("" if usage is None else f" ({usage})")
+            )
+            if success:
+                _history.record(package_name, runner_name, toc - tic, total, hints)
+
+
+@contextlib.asynccontextmanager
+async def async_summary(package_name, runner_name, hints=None):
+    """Asynchronous context manager equivalent of ``ubermagutil.progress.summary``.
+
+    Because runs can overlap, the summary is printed as a single line at the end
+    of the run instead of being split into a start and an end part.
+
+    """
+    now = datetime.datetime.now()
+    with _run_context(package_name, runner_name):
+        tic = time.time()
+        success = False
+        try:
+            yield
+            success = True
+        finally:
+            toc = time.time()
+            print(
+                f"Running {package_name} ({runner_name})"
+                f"[{now.isoformat(timespec='seconds')}]... ({toc - tic:0.1f} s)"
+            )
+            if success:
+                _history.record(package_name, runner_name, toc - tic, hints=hints)
 
 
 def quiet():
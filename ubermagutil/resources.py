@@ -0,0 +1,411 @@
+"""Sampling of resources used by a process tree and memory instrumentation."""
+
+import contextlib
+import os
+import threading
+import time
+import tracemalloc
+
+from . import units
+
+_PROC = "/proc"
+
+
+def _read_stat(pid):
+    """Parent pid, CPU time in seconds, and RSS in bytes from ``/proc/<pid>/stat``."""
+    with open(f"{_PROC}/{pid}/stat", encoding="utf-8") as f:
+        content = f.read()
+    # The command name can contain spaces and parentheses.
+    fields = content[content.rfind(")") + 2 :].split()
+    ppid = int(fields[1])
+    cpu = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    rss = int(fields[21]) * os.sysconf("SC_PAGE_SIZE")
+    return ppid, cpu, rss
+
+
+def _read_children(pid):
+    """Child pids from ``/proc/<pid>/task/<tid>/children`` of all threads."""
+    children = []
+    for tid in os.listdir(f"{_PROC}/{pid}/task"):
+        try:
+            with open(f"{_PROC}/{pid}/task/{tid}/children", encoding="utf-8") as f:
+                children.extend(int(child) for child in f.read().split())
+        except OSError:
+            continue  # thread exited
+    return children
+
+
+def _read_io(pid):
+    """Read and written bytes from ``/proc/<pid>/io`` or zeros if not readable."""
+    try:
+        with open(f"{_PROC}/{pid}/io", encoding="utf-8") as f:
+            values = dict(line.split(": ") for line in f.read().splitlines())
+    except OSError:
+        return 0, 0
+    return int(values.get("read_bytes", 0)), int(values.get("write_bytes", 0))
+
+
+class ResourceUsage:
+    """Summary of resources used by a process tree.
+
+    Attributes
+    ----------
+    duration : float
+
+        Wall time between the first and the last sample in seconds.
+
+    cpu_time : float
+
+        CPU time (user and system) in seconds.
+
+    cpu_avg, cpu_peak : float
+
+        Average and peak CPU usage in cores (``1`` is one fully used core).
+
+    rss_avg, rss_peak : float
+
+        Average and peak resident memory in bytes.
+
+    read_bytes, write_bytes : int
+
+        Bytes read from and written to storage.
+
+    samples : int
+
+        Number of samples.
+
+    """
+
+    def __init__(
+        self,
+        duration=0,
+        cpu_time=0,
+        cpu_avg=0,
+        cpu_peak=0,
+        rss_avg=0,
+        rss_peak=0,
+        read_bytes=0,
+        write_bytes=0,
+        samples=0,
+    ):
+        self.duration = duration
+        self.cpu_time = cpu_time
+        self.cpu_avg = cpu_avg
+        self.cpu_peak = cpu_peak
+        self.rss_avg = rss_avg
+        self.rss_peak = rss_peak
+        self.read_bytes = read_bytes
+        self.write_bytes = write_bytes
+        self.samples = samples
+
+    def __str__(self):
+        return (
+            f"CPU {self.cpu_avg:.1f} cores avg ({self.cpu_peak:.1f} peak),"
+            f" RSS {units.si_format(self.rss_peak, 'B')} peak"
+            f" ({units.si_format(self.rss_avg, 'B')} avg),"
+            f" I/O {units.si_format(self.read_bytes, 'B')} read,"
+            f" {units.si_format(self.write_bytes, 'B')} written"
+        )
+
+    def __repr__(self):
+        attributes = ", ".join(f"{k}={v!r}" for k, v in vars(self).items())
+        return f"{self.__class__.__name__}({attributes})"
+
+
+class ResourceSampler:
+    """Sample CPU time, resident memory, and I/O of a process tree.
+
+    Every call to ``sample`` reads ``/proc`` (Linux only, no additional
+    dependencies) for the process ``pid`` and all its descendants, which are
+    found by walking ``/proc/<pid>/task/<tid>/children`` from ``pid``. Only on
+    kernels without these files, all processes are scanned. CPU time and
+    I/O bytes are counted from the first sample; for processes which exit
+    between samples, their last sampled values are kept. The summary of all
+    samples is available as ``usage``.
+
+    Parameters
+    ----------
+    pid : int, optional
+
+        Root of the process tree. Defaults to the current process, so that
+        simulations started as subprocesses are included.
+
+    Raises
+    ------
+    OSError
+
+        If ``/proc`` is not available.
+
+    Examples
+    --------
+    1. Resources used by the current process.
+
+    >>> import sys
+    >>> import ubermagutil.resources as ur
+    ...
+    >>> if sys.platform.startswith('linux'):
+    ...     sampler = ur.ResourceSampler()
+    ...     sampler.sample()
+    ...     sampler.sample()
+    ...     assert sampler.usage.rss_peak > 0
+
+    """
+
+    def __init__(self, pid=None):
+        self.pid = os.getpid() if pid is None else pid
+        _read_stat(self.pid)  # raises OSError if /proc is not available
+        self._walk = os.path.exists(f"{_PROC}/{self.pid}/task/{self.pid}/children")
+        self._processes = {}  # pid -> (cpu, read_bytes, write_bytes)
+        self._first = self._last = None  # (timestamp, cpu, read_bytes, write_bytes)
+        self._rss_sum = 0
+        self._rss_peak = 0
+        self._cpu_peak = 0
+        self._samples = 0
+
+    def _tree(self):
+        if not self._walk:
+            return self._scan_tree()
+        tree, stack = [], [self.pid]
+        while stack:
+            pid = stack.pop()
+            try:
+                _, cpu, rss = _read_stat(pid)
+                children = _read_children(pid)
+            except (OSError, ValueError, IndexError):
+                continue  # process exited
+            tree.append((pid, cpu, rss))
+            stack.extend(children)
+        return tree
+
+    def _scan_tree(self):
+        children = {}
+        for entry in os.scandir(_PROC):
+            if entry.name.isdigit():
+                try:
+                    ppid, cpu, rss = _read_stat(entry.name)
+                except (OSError, ValueError, IndexError):
+                    continue  # process exited
+                children.setdefault(ppid, []).append((int(entry.name), cpu, rss))
+        try:
+            _, cpu, rss = _read_stat(self.pid)
+        except OSError:
+            return []
+        tree, stack = [(self.pid, cpu, rss)], [self.pid]
+        while stack:
+            for child in children.get(stack.pop(), []):
+                tree.append(child)
+                stack.append(child[0])
+        return tree
+
+    def sample(self, timestamp=None):
+        """Add a sample of the process tree taken at ``timestamp``."""
+        timestamp = time.monotonic() if timestamp is None else timestamp
+        rss = 0
+        for pid, cpu, process_rss in self._tree():
+            rss += process_rss
+            self._processes[pid] = (cpu, *_read_io(pid))
+        totals = [sum(values) for values in zip(*self._processes.values())]
+        cpu = totals[0]
+
+        if self._first is None:
+            self._first = (timestamp, *totals)
+        elif timestamp > self._last[0]:
+            usage = (cpu - self._last[1]) / (timestamp - self._last[0])
+            self._cpu_peak = max(self._cpu_peak, usage)
+        self._last = (timestamp, *totals)
+        self._rss_sum += rss
+        self._rss_peak = max(self._rss_peak, rss)
+        self._samples += 1
+
+    @property
+    def usage(self):
+        """``ResourceUsage`` summarising all samples."""
+        if self._first is None:
+            return ResourceUsage()
+        duration = self._last[0] - self._first[0]
+        cpu_time = self._last[1] - self._first[1]
+        return ResourceUsage(
+            duration=duration,
+            cpu_time=cpu_time,
+            cpu_avg=cpu_time / duration if duration > 0 else 0,
+            cpu_peak=self._cpu_peak,
+            rss_avg=self._rss_sum / self._samples,
+            rss_peak=self._rss_peak,
+            read_bytes=self._last[2] - self._first[2],
+            write_bytes=self._last[3] - self._first[3],
+            samples=self._samples,
+        )
+
+
+def _current_rss():
+    """RSS of the current process in bytes or ``None`` if ``/proc`` is missing."""
+    try:
+        return _read_stat(os.getpid())[2]
+    except OSError:
+        return None
+
+
+class MemoryUsage:
+    """Memory used by a block wrapped in ``ubermagutil.resources.memory``.
+
+    Attributes
+    ----------
+    peak : int or None
+
+        Peak size of Python allocations made in the block in bytes (relative to
+        the start of the block) or ``None`` if tracemalloc was not used.
+
+    top : list
+
+        Allocation sites with the largest size of memory still allocated at the
+        end of the block as ``(site, size, count)`` tuples, where ``site`` is
+        ``'filename:lineno'``.
+
+    rss_start, rss_end, rss_peak : int or None
+
+        Resident memory of the process in bytes at the start and at the end of
+        the block, and the sampled peak, or ``None`` if not available.
+
+    """
+
+    def __init__(self):
+        self.peak = None
+        self.top = []
+        self.rss_start = None
+        self.rss_end = None
+        self.rss_peak = None
+
+    @property
+    def rss_delta(self):
+        """Change of resident memory in bytes or ``None`` if not available."""
+        if self.rss_start is None or self.rss_end is None:
+            return None
+        return self.rss_end - self.rss_start
+
+    def __str__(self):
+        parts = []
+        if self.peak is not None:
+            parts.append(f"Python peak {units.si_format(self.peak, 'B')}")
+        if self.rss_delta is not None:
+            sign = "-" if self.rss_delta < 0 else "+"
+            rss = f"RSS {sign}{units.si_format(abs(self.rss_delta), 'B')}"
+            if self.rss_peak is not None:
+                rss += f" (peak {units.si_format(self.rss_peak, 'B')})"
+            parts.append(rss)
+        return ", ".join(parts)
+
+    def __repr__(self):
+        attributes = ", ".join(f"{k}={v!r}" for k, v in vars(self).items())
+        return f"{self.__class__.__name__}({attributes})"
+
+
+@contextlib.contextmanager
+def memory(nframes=1, top=10, interval=None):
+    """Context manager measuring the memory used by the wrapped block.
+
+    Python allocations are traced with ``tracemalloc``, whose overhead grows
+    with the number of stored frames ``nframes``; with ``nframes=0``, only the
+    resident memory is measured, which has no overhead on the block. The
+    resident memory (Linux only) is read at the start and the end of the block
+    and, if ``interval`` is given, sampled by a background thread to find its
+    peak. If tracemalloc is already tracing, it is not stopped at the end, but
+    its peak is reset.
+
+    Parameters
+    ----------
+    nframes : int, optional
+
+        Number of frames stored by tracemalloc for each allocation. Defaults to
+        ``1``.
+
+    top : int, optional
+
+        Number of allocation sites in ``MemoryUsage.top``. Defaults to ``10``.
+
+    interval : numbers.Real, optional
+
+        Interval in seconds for sampling the resident memory. Defaults to
+        ``None``.
+
+    Yields
+    ------
+    ubermagutil.resources.MemoryUsage
+
+        Memory usage, which is filled in at the end of the block.
+
+    Examples
+    --------
+    1. Memory used for allocating a list.
+
+    >>> import ubermagutil.resources as ur
+    ...
+    >>> with ur.memory() as usage:
+    ...     data = [0] * 10**6
+    >>> usage.peak >= 8e6
+    True
+    >>> usage.top[0][1] >= 8e6  # (site, size, count)
+    True
+    >>> str(usage)
+    'Python peak 8.0 MB, RSS ...'
+
+    """
+    usage = MemoryUsage()
+    tracing = nframes > 0
+    was_tracing = tracemalloc.is_tracing()
+    start = None
+    if tracing:
+        if was_tracing:
+            start = tracemalloc.take_snapshot()
+            tracemalloc.reset_peak()
+        else:
+            tracemalloc.start(nframes)
+        traced_start = tracemalloc.get_traced_memory()[0]
+
+    usage.rss_start = usage.rss_peak = _current_rss()
+    sampler = None
+    if interval is not None and usage.rss_start is not None:
+        stop = threading.Event()
+
+        def sample():
+            while not stop.wait(interval):
+                usage.rss_peak = max(usage.rss_peak, _current_rss() or 0)
+
+        sampler = threading.Thread(target=sample, daemon=True)
+        sampler.start()
+    try:
+        yield usage
+    finally:
+        if sampler is not None:
+            stop.set()
+            sampler.join()
+        usage.rss_end = _current_rss()
+        if usage.rss_end is not None:
+            usage.rss_peak = max(usage.rss_peak, usage.rss_end)
+        if interval is None:
+            usage.rss_peak = None  # not sampled
+
+        if tracing:
+            usage.peak = max(tracemalloc.get_traced_memory()[1] - traced_start, 0)
+            snapshot = tracemalloc.take_snapshot()
+            if not was_tracing:
+                tracemalloc.stop()
+            snapshot = snapshot.filter_traces(
+                [
+                    tracemalloc.Filter(False, tracemalloc.__file__),
+                    tracemalloc.Filter(False, __file__),
+                ]
+            )
+            if start is None:
+                statistics = snapshot.statistics("lineno")
+                sites = [(s.traceback[0], s.size, s.count) for s in statistics]
+            else:
+                statistics = snapshot.compare_to(start, "lineno")
+                sites = [
+                    (s.traceback[0], s.size_diff, s.count_diff)
+                    for s in statistics
+                    if s.size_diff > 0
+                ]
+            usage.top = [
+                (f"{frame.filename}:{frame.lineno}", size, count)
+                for frame, size, count in sites[:top]
+            ]
@@ -0,0 +1,9 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def history(tmp_path, monkeypatch):
+    """Record runs in a temporary history instead of the user cache."""
+    path = tmp_path / "cache" / "runs.jsonl"
+    monkeypatch.setenv("UBERMAG_HISTORY", str(path))
+    return path
@@ -1,4 +1,11 @@
+import concurrent.futures
+import json
 import logging
+import os
+import threading
+import time
+
+import pytest
 
 import ubermagutil
 
@@ -47,3 +54,126 @@ def test_setup_logging_per_package():
     }
     ubermagutil.setup_logging(level=logging.INFO, package_levels=package_levels)
     check_levels(logging.INFO, package_levels)
+
+
+class SlowHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+        self.threads = set()
+        self.emitting = threading.Event()
+        self.unblock = threading.Event()
+
+    def emit(self, record):
+        self.emitting.set()
+        self.unblock.wait()
+        self.threads.add(threading.current_thread())
+        self.messages.append(record.getMessage())
+
+
+def test_setup_logging_queue():
+    handler = SlowHandler()
+    root = logging.getLogger()
+    root.addHandler(handler)
+    try:
+        ubermagutil.setup_logging(logging.INFO, queue=True, queue_size=5)
+        check_levels(logging.INFO)
+        log = logging.getLogger("oommfc.drivers")
+        log.info("first")
+        assert handler.emitting.wait(5)  # handler blocks the listener thread
+        for i in range(10):
+            log.info("record %d", i)  # does not wait for the handler
+        assert handler.messages == []
+
+        handler.unblock.set()
+        while len(handler.messages) < 6:  # wait until the queue is processed
+            time.sleep(0.01)
+        log.info("after")
+        ubermagutil.setup_logging()  # flushes the queue
+        assert handler.messages == [
+            "first",
+            *(f"record {i}" for i in range(5)),
+            "5 log records dropped (queue full).",
+            "after",
+        ]
+        assert threading.current_thread() not in handler.threads
+
+        log.warning("synchronous")
+        assert handler.messages[-1] == "synchronous"
+        assert threading.current_thread() in handler.threads
+    finally:
+        handler.unblock.set()
+        root.removeHandler(handler)
+        ubermagutil.setup_logging()
+
+
+def test_setup_logging_json(tmp_path):
+    filename = tmp_path / "ubermag.jsonl"
+    try:
+        ubermagutil.setup_logging(
+            logging.INFO, fmt="json", filename=filename, context={"worker": 0}
+        )
+        log = logging.getLogger("ubermagutil.test")
+        log.info("plain")
+        with ubermagutil.progress.summary("pkg", "runner"):
+            log.info("in %s", "summary")
+        try:
+            raise ZeroDivisionError("division by zero")
+        except ZeroDivisionError:
+            log.exception("failed")
+        logging.getLogger("other").warning("not in the file")
+    finally:
+        ubermagutil.setup_logging()
+
+    entries = [json.loads(line) for line in filename.read_text().splitlines()]
+    assert [entry["message"] for entry in entries] == [
+        "plain",
+        "in summary",
+        "failed",
+    ]
+    assert all(entry["pid"] == os.getpid() for entry in entries)
+    assert all(entry["worker"] == 0 for entry in entries)
+    assert entries[0]["level"] == "INFO"
+    assert entries[0]["logger"] == "ubermagutil.test"
+    assert "runner" not in entries[0]
+    assert entries[1]["package"] == "pkg"
+    assert entries[1]["runner"] == "runner"
+    assert len(entries[1]["run_id"]) == 32
+    assert "ZeroDivisionError" in entries[2]["exception"]
+
+    with pytest.raises(ValueError):
+        ubermagutil.setup_logging(fmt="xml")
+    with pytest.raises(ValueError):
+        ubermagutil.setup_logging(queue="thread")
+
+
+def work(i):
+    with ubermagutil.basic_logging.log_context(run_id=i):
+        logging.getLogger("oommfc.test").info("run %d", i)
+    return os.getpid()
+
+
+def test_setup_logging_processes(tmp_path):
+    filename = tmp_path / "ubermag.jsonl"
+    try:
+        records = ubermagutil.setup_logging(
+            logging.INFO, queue="process", fmt="json", filename=filename
+        )
+        executor = concurrent.futures.ProcessPoolExecutor(
+            2,
+            initializer=ubermagutil.setup_logging,
+            initargs=(logging.INFO, None, records, 10000, "text", None, {"w": 1}),
+        )
+        with executor:
+            pids = set(executor.map(work, range(20)))
+        logging.getLogger("ubermagutil.test").info("parent")
+    finally:
+        ubermagutil.setup_logging()
+
+    entries = [json.loads(line) for line in filename.read_text().splitlines()]
+    assert sorted(entry["run_id"] for entry in entries[:-1]) == list(range(20))
+    assert all(entry["message"] == f"run {entry['run_id']}" for entry in entries[:-1])
+    assert {entry["pid"] for entry in entries[:-1]} == pids
+    assert all(entry["w"] == 1 for entry in entries[:-1])
+    assert entries[-1]["message"] == "parent"
+    assert entries[-1]["pid"] == os.getpid()
@@ -0,0 +1,100 @@
+import json
+
+import pytest
+
+import ubermagutil as uu
+import ubermagutil.history as uh
+
+
+def test_history_path(tmp_path, monkeypatch):
+    monkeypatch.delenv("UBERMAG_HISTORY", raising=False)
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    assert uh.history_path() == str(tmp_path / "ubermag" / "runs.jsonl")
+
+    monkeypatch.setenv("UBERMAG_HISTORY", "")
+    assert uh.history_path() is None
+    uh.record("pkg", "runner", 1)  # disabled, no error
+    assert uh.runs() == []
+
+
+def test_record_runs(history):
+    uh.record("pkg", "runner", 1.5, total=3, hints={"n": 10})
+    uh.record("pkg", "other", 2)
+    with open(history, "a", encoding="utf-8") as f:
+        f.write('{"package": "pkg", "dura')  # interrupted write
+    uh.record("other", "runner", 3)
+
+    assert len(uh.runs()) == 3
+    (run,) = uh.runs("pkg", "runner")
+    assert run["duration"] == 1.5
+    assert run["total"] == 3
+    assert run["hints"] == {"n": 10}
+    assert len(uh.runs(runner_name="runner")) == 2
+    assert uh.runs(hints={"n": 11}) == []
+
+
+def test_record_unwritable(tmp_path, caplog):
+    path = tmp_path / "file"
+    path.touch()
+    uh.record("pkg", "runner", 1, path=str(path / "runs.jsonl"))  # logs, no raise
+    assert "Cannot record run" in caplog.text
+
+    uh.record("pkg", "runner", 1, hints={"n": object()}, path=str(tmp_path / "r"))
+    assert "not JSON serializable" in caplog.text
+
+
+def test_history_size(history, monkeypatch):
+    monkeypatch.setattr(uh, "MAX_SIZE", 2000)
+    for i in range(100):
+        uh.record("pkg", "runner", i)
+        assert history.stat().st_size <= 2000
+    durations = [run["duration"] for run in uh.runs()]
+    assert durations == list(range(100 - len(durations), 100))
+    assert 5 < len(durations) < 20
+
+    # only the last MAX_SIZE bytes are read
+    monkeypatch.setattr(uh, "MAX_SIZE", 200)
+    assert [run["duration"] for run in uh.runs()] == durations[-len(uh.runs()) :]
+    assert 0 < len(uh.runs()) < 3
+
+
+def test_predict(history):
+    assert uh.predict("pkg", "runner") is None
+
+    uh.record("pkg", "runner", 5, total=10)
+    assert uh.predict("pkg", "runner") == 5
+    assert uh.predict("pkg", "runner", total=20) == pytest.approx(10)
+
+    # overhead of 2 s and 0.5 s per item
+    uh.record("pkg", "linear", 7, total=10)
+    uh.record("pkg", "linear", 12, total=20)
+    uh.record("pkg", "linear", 7, total=10)
+    assert uh.predict("pkg", "linear", total=40) == pytest.approx(22)
+
+    # hints select matching runs only
+    uh.record("pkg", "runner", 100, total=10, hints={"n": 1000})
+    assert uh.predict("pkg", "runner", total=10, hints={"n": 1000}) == 100
+    assert uh.predict("pkg", "runner", total=10, hints={}) < 10
+
+    assert uh.predict("pkg", "other") is None
+
+
+def test_summary_bar_record(history, tmp_path):
+    with uu.progress.summary("pkg", "summary", hints={"n": 1}):
+        pass
+    with uu.progress.bar(2, "pkg", "bar", f"{tmp_path}/*.out"):
+        pass
+    with pytest.raises(RuntimeError), uu.progress.summary("pkg", "summary"):
+        raise RuntimeError  # failed runs are not recorded
+
+    runs = [json.loads(line) for line in history.read_text().splitlines()]
+    assert [(run["runner"], run["total"], run["hints"]) for run in runs] == [
+        ("summary", None, {"n": 1}),
+        ("bar", 2, {}),
+    ]
+
+    # ETA from the history before the first file is written
+    uh.record("pkg", "bar", 100, total=2)
+    with uu.progress.bar(2, "pkg", "bar", f"{tmp_path}/*.out") as progress_bar:
+        assert progress_bar.expected_duration == pytest.approx(50, rel=0.1)
+        assert 0 < progress_bar.eta <= progress_bar.expected_duration
@@ -0,0 +1,71 @@
+import pstats
+import threading
+
+import pytest
+
+import ubermagutil.profiling as up
+
+
+def work():
+    return sorted(str(i) for i in range(10**5))
+
+
+def test_profile_disabled(tmp_path, monkeypatch):
+    monkeypatch.delenv("UBERMAG_PROFILE", raising=False)
+    with up.profile("pkg", "runner", directory=tmp_path) as path:
+        work()
+    assert path is None
+    assert list(tmp_path.iterdir()) == []
+
+    with pytest.raises(ValueError), up.profile("pkg", "runner", "perf"):
+        pass
+
+
+def test_profile_cprofile(tmp_path):
+    with up.profile("my pkg", "runner", "cprofile", tmp_path / "out") as path:
+        work()
+    assert path.parent == tmp_path / "out"
+    assert path.name.startswith("my-pkg_runner_")
+    assert path.suffix == ".prof"
+    stats = pstats.Stats(str(path))
+    assert any(func[2] == "work" for func in stats.stats)
+
+    # repeated calls within one second do not overwrite profiles
+    for _ in range(3):
+        with up.profile("my pkg", "runner", "cprofile", tmp_path / "out"):
+            pass
+    assert len(list((tmp_path / "out").glob("*.prof"))) == 4
+
+
+def test_profile_decorator_env(tmp_path, monkeypatch):
+    monkeypatch.setenv("UBERMAG_PROFILE", "sample")
+    monkeypatch.setenv("UBERMAG_PROFILE_DIR", str(tmp_path))
+
+    @up.profile("pkg", "runner", interval=0.001)
+    def run():
+        for _ in range(5):
+            work()
+
+    run()
+    (path,) = tmp_path.glob("pkg_runner_*.folded")
+    lines = path.read_text().splitlines()
+    assert lines
+    stack, count = lines[0].rsplit(" ", 1)
+    assert int(count) > 0
+    assert any("work (test_profiling.py:" in line for line in lines)
+
+
+def test_stack_sampler_thread():
+    sampler = up.StackSampler(interval=0.001)
+
+    def target():
+        sampler.start()
+        for _ in range(5):
+            work()
+        sampler.stop()
+
+    thread = threading.Thread(target=target)
+    thread.start()
+    thread.join()
+    assert sum(sampler.counts.values()) > 0
+    assert all(stack.startswith("_bootstrap ") for stack in sampler.counts)
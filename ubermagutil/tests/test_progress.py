@@ -1,5 +1,16 @@
+import asyncio
+import glob
+import io
+import json
+import re
+import socket
+import subprocess
+import sys
+import threading
 import time
 
+import pytest
+
 import ubermagutil as uu
 
 
@@ -20,6 +31,336 @@ def test_bar(capsys, tmp_path):
     assert "files written" in captured.err  # tqdm writes to stderr
 
 
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="requires /proc")
+def test_bar_resources(capsys, tmp_path):
+    with uu.progress.bar(
+        total=1,
+        package_name="my package",
+        runner_name="my runner",
+        glob_name=f"{str(tmp_path)}/*.out",
+        resources=True,
+    ) as progress_bar:
+        (tmp_path / "0.out").touch()
+    usage = progress_bar.resource_usage
+    assert usage.samples >= 2
+    assert usage.rss_peak > 0
+    captured = capsys.readouterr()
+    assert f"({usage})" in captured.out
+
+    with uu.progress.bar(1, "pkg", "runner", f"{tmp_path}/*.out") as progress_bar:
+        pass
+    assert progress_bar.resource_usage is None
+    assert "CPU" not in capsys.readouterr().out
+
+
+def test_summary_memory(capsys):
+    with uu.progress.summary("pkg", "runner") as usage:
+        pass
+    assert usage is None
+    assert re.search(r"\(\d+\.\d s\)$", capsys.readouterr().out)
+
+    with uu.progress.summary("pkg", "runner", memory=True) as usage:
+        data = [0] * 10**6
+    assert usage.peak >= 8 * len(data)
+    out = capsys.readouterr().out
+    assert re.search(r"\(\d+\.\d s, Python peak \d+\.\d MB, RSS [+-]", out)
+
+
+def test_bar_latency(tmp_path):
+    # Termination must not wait for the next polling interval.
+    tic = time.perf_counter()
+    with uu.progress.bar(
+        total=1,
+        package_name="my package",
+        runner_name="my runner",
+        glob_name=f"{str(tmp_path)}/*.out",
+    ):
+        pass
+    assert time.perf_counter() - tic < 0.5 * uu.progress.ProgressBar.INTERVAL
+
+    progress_bar = uu.progress.ProgressBar(1, "pkg", "runner", f"{tmp_path}/*.out")
+    progress_bar.start()
+    time.sleep(0.05)  # thread is waiting for the next update
+    (tmp_path / "0.out").touch()
+    tic = time.perf_counter()
+    progress_bar.terminate()
+    assert time.perf_counter() - tic < 0.5 * progress_bar.INTERVAL
+    assert progress_bar.bar.n == 1  # final count
+
+
+def test_bar_adaptive_interval(tmp_path):
+    progress_bar = uu.progress.ProgressBar(
+        20, "pkg", "runner", f"{tmp_path}/*.out", min_interval=0.01, max_interval=0.05
+    )
+    assert progress_bar.interval == 0.05
+    assert progress_bar.rate is None
+    assert progress_bar.eta is None
+    progress_bar.start()
+    try:
+        time.sleep(0.3)  # no files written
+        assert progress_bar.interval == 0.05
+        for i in range(10):
+            (tmp_path / f"{i}.out").touch()
+            time.sleep(0.03)
+        assert progress_bar.interval < 0.05
+        assert 5 < progress_bar.rate < 100
+        assert 0 < progress_bar.eta < 10
+    finally:
+        progress_bar.terminate()
+    assert progress_bar.bar.n == 10
+    assert "files/s" in str(progress_bar.bar)
+
+    # directory listings are not done more often than every INTERVAL
+    for backend in ["glob", "scandir"]:
+        progress_bar = uu.progress.ProgressBar(
+            1, "pkg", "runner", f"{tmp_path}/*.out", backend, disable=True
+        )
+        assert progress_bar.min_interval == progress_bar.INTERVAL
+        progress_bar.counter.close()
+    with uu.progress.bar(
+        1, "pkg", "runner", f"{tmp_path}/*.out", "glob", min_interval=0.01
+    ) as progress_bar:
+        assert progress_bar.min_interval == 0.01
+
+
+def test_rate_estimator():
+    estimator = uu.progress.RateEstimator(total=100, tau=2)
+    assert estimator.rate is None
+    assert estimator.eta is None
+    estimator.update(0, timestamp=0)
+    assert estimator.rate is None
+    estimator.update(10, timestamp=1)
+    assert estimator.rate == 10
+    assert estimator.eta == 9
+    estimator.update(10, timestamp=2)  # average rate during the first tau
+    assert estimator.rate == 5
+    estimator.update(10, timestamp=2)  # zero time difference is ignored
+    assert estimator.rate == 5
+    estimator.update(10, timestamp=100)  # stalled for a long time
+    assert estimator.rate < 1e-3
+    estimator.update(20, timestamp=101)
+    assert 3 < estimator.rate < 10
+
+    estimator = uu.progress.RateEstimator()
+    estimator.update(0, timestamp=0)
+    estimator.update(5, timestamp=1)
+    assert estimator.rate == 5
+    assert estimator.eta is None
+
+    # first two updates more than tau apart
+    estimator = uu.progress.RateEstimator(total=10)
+    estimator.update(0, timestamp=0)
+    estimator.update(5, timestamp=20)
+    assert estimator.rate == 0.25
+    assert estimator.eta == 20
+
+
+@pytest.mark.parametrize("aggregate", [False, True])
+def test_progress_service(capsys, tmp_path, aggregate):
+    service = uu.progress.ProgressService(aggregate=aggregate)
+    service.INTERVAL = 0.01
+    n_threads = threading.active_count()
+    handles = []
+    for i in range(10):
+        (tmp_path / str(i)).mkdir()
+        handles.append(
+            service.register(3, "my package", f"runner {i}", f"{tmp_path}/{i}/*.out")
+        )
+    assert threading.active_count() == n_threads + 1
+
+    for i, handle in enumerate(handles):
+        for j in range(i % 4):
+            (tmp_path / str(i) / f"{j}.out").touch()
+        time.sleep(0.02)
+        assert service.unregister(handle) == i % 4
+    assert service.completed == 10
+
+    with service.bar(1, "my package", "my runner", f"{tmp_path}/*.out"):
+        (tmp_path / "0.out").touch()
+    service.close()
+    assert not service.is_alive()
+    if aggregate:
+        assert service.aggregate_bar.n == sum(i % 4 for i in range(10)) + 1
+        assert service.aggregate_bar.total == 31
+
+    captured = capsys.readouterr()
+    assert "Running my package (my runner)" in captured.out
+    assert "took" in captured.out
+    if aggregate:
+        assert "11/11 runs completed" in captured.err
+    else:
+        assert "runner 9" in captured.err
+
+
+def test_progress_service_unregister(tmp_path):
+    class Counter:
+        def __init__(self, counter):
+            self.counter = counter
+            self.calls = 0
+
+        def count(self):
+            self.calls += 1
+            return self.counter.count()
+
+        def close(self):
+            self.counter.close()
+
+    service = uu.progress.ProgressService(aggregate=True)
+    service.INTERVAL = 60
+    try:
+        handles = [
+            service.register(1, "my package", "my runner", f"{tmp_path}/*.out")
+            for _ in range(3)
+        ]
+        time.sleep(0.05)  # first refresh of the polling thread
+        counters = {}
+        for handle, (counter, run_bar) in service._runs.items():
+            counters[handle] = Counter(counter)
+            service._runs[handle] = (counters[handle], run_bar)
+        service.unregister(handles[0])
+        assert [counter.calls for counter in counters.values()] == [1, 0, 0]
+        assert service.completed == 1
+    finally:
+        service.close()
+
+
+def test_headless(capsys, tmp_path):
+    events = []
+    with uu.progress.headless(
+        "my package",
+        "my runner",
+        events.append,
+        total=5,
+        glob_name=f"{tmp_path}/*.out",
+        min_interval=0,
+    ):
+        for i in range(5):
+            (tmp_path / f"{i}.out").touch()
+            time.sleep(0.15)
+    captured = capsys.readouterr()
+    assert captured.out == captured.err == ""
+
+    assert events[0]["event"] == "start"
+    assert events[-1]["event"] == "finish"
+    assert events[-1]["count"] == 5
+    assert events[-1]["duration"] >= 0.75
+    assert "error" not in events[-1]
+    updates = [event for event in events if event["event"] == "update"]
+    assert 1 <= len(updates) <= 5
+    assert [event["count"] for event in updates] == sorted(
+        event["count"] for event in updates
+    )
+    for event in events:
+        assert event["package_name"] == "my package"
+        assert event["runner_name"] == "my runner"
+        assert event["total"] == 5
+        assert isinstance(event["time"], float)
+
+
+def test_headless_sinks(tmp_path):
+    path = tmp_path / "events.jsonl"
+    with pytest.raises(RuntimeError), uu.progress.headless("pkg", "runner", path):
+        raise RuntimeError("failed")
+    with uu.progress.headless("pkg", "runner", str(path)):
+        pass
+    events = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [event["event"] for event in events] == ["start", "finish"] * 2
+    assert "RuntimeError" in events[1]["error"]
+
+    stream = io.StringIO()
+    with uu.progress.headless("pkg", "runner", stream):
+        pass
+    assert len(stream.getvalue().splitlines()) == 2
+
+    with socket.create_server(("127.0.0.1", 0)) as server:
+        with uu.progress.headless("pkg", "runner", server.getsockname()):
+            connection, _ = server.accept()
+        with connection, connection.makefile() as f:
+            assert json.loads(f.readline())["event"] == "start"
+            assert json.loads(f.readline())["event"] == "finish"
+
+    with pytest.raises(TypeError):
+        uu.progress.EventEmitter(42)
+
+
+def test_event_emitter_rate_limit():
+    events = []
+    emitter = uu.progress.EventEmitter(events.append, min_interval=60, run=1)
+    for i in range(10):
+        emitter.emit("update", count=i)
+    emitter.emit("update", force=True, count=10)
+    emitter.emit("finish")
+    assert [event.get("count") for event in events] == [0, 10, None]
+    assert all(event["run"] == 1 for event in events)
+
+
+@pytest.mark.parametrize("backend", ["auto", "scandir", "glob"])
+def test_async_bar(capsys, tmp_path, backend):
+    n_runs = 50
+    n_threads = threading.active_count()
+    thread_counts = []
+
+    async def run(i):
+        (tmp_path / str(i)).mkdir()
+        async with uu.progress.async_bar(
+            3, "my package", f"runner {i}", f"{tmp_path}/{i}/*.out", backend=backend
+        ) as progress_bar:
+            for j in range(3):
+                (tmp_path / str(i) / f"{j}.out").touch()
+                await asyncio.sleep(0.01)
+                thread_counts.append(threading.active_count())
+        return progress_bar
+
+    async def main():
+        return await asyncio.gather(*(run(i) for i in range(n_runs)))
+
+    tic = time.perf_counter()
+    progress_bars = asyncio.run(main())
+    assert time.perf_counter() - tic < 5
+    assert all(progress_bar.bar.n == 3 for progress_bar in progress_bars)
+    assert all(not progress_bar.is_alive() for progress_bar in progress_bars)
+    assert max(thread_counts) == n_threads  # no executor threads
+
+    captured = capsys.readouterr()
+    assert captured.out.count("took") == n_runs
+    assert "runner 49" in captured.err
+
+
+def test_async_bar_stream_counter(capsys):
+    code = "for i in range(1, 6): print(f'step {i}', flush=True)"
+
+    async def main():
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, "-c", code, stdout=asyncio.subprocess.PIPE
+        )
+        counter = uu.progress.StreamCounter(
+            process.stdout, pattern=re.compile(rb"step (\d+)")
+        )
+        with pytest.raises(RuntimeError):
+            counter.close()  # would block the event loop
+        async with uu.progress.async_bar(
+            5, "my package", "my runner", None, counter=counter, unit="steps"
+        ) as progress_bar:
+            await process.wait()
+        return counter, progress_bar
+
+    counter, progress_bar = asyncio.run(main())
+    assert counter.count() == 5
+    assert progress_bar.bar.n == 5
+    assert "took" in capsys.readouterr().out
+
+
+def test_async_summary(capsys):
+    async def main():
+        async with uu.progress.async_summary("my package", "my runner"):
+            await asyncio.sleep(0)
+
+    asyncio.run(main())
+    captured = capsys.readouterr()
+    assert "Running my package (my runner)" in captured.out
+    assert captured.err == ""
+
+
 def test_summary(capsys):
     with uu.progress.summary("my package", "my runner"):
         pass
@@ -34,3 +375,168 @@ def test_quiet(capsys):
     captured = capsys.readouterr()
     assert captured.out == ""
     assert captured.err == ""
+
+
+@pytest.mark.parametrize("backend", ["auto", "glob", "scandir", "inotify"])
+def test_file_counter(tmp_path, backend):
+    if backend == "inotify" and not sys.platform.startswith("linux"):
+        pytest.skip("inotify is only available on Linux")
+    (tmp_path / "old.omf").touch()
+    counter = uu.progress.file_counter(f"{tmp_path}/*.omf", backend=backend)
+    assert counter.count() == 1
+    for i in range(5):
+        (tmp_path / f"m{i}.omf").touch()
+        (tmp_path / f"m{i}.odt").touch()
+    (tmp_path / ".hidden.omf").touch()
+    assert counter.count() == 6
+    (tmp_path / "old.omf").unlink()
+    (tmp_path / "m0.omf").rename(tmp_path / "m0.bak")
+    (tmp_path / "m0.odt").rename(tmp_path / "m10.omf")
+    assert counter.count() == 5
+    assert counter.count() == len(glob.glob(f"{tmp_path}/*.omf"))
+    counter.close()
+
+
+def test_heartbeat(tmp_path):
+    glob_name = f"{tmp_path}/*.omf"
+    assert uu.progress.heartbeat_path(glob_name) == str(tmp_path / ".ubermag-heartbeat")
+    counter = uu.progress.file_counter(glob_name, backend="heartbeat")
+    assert isinstance(counter, uu.progress.HeartbeatCounter)
+    assert counter.count() == 0
+    uu.progress.write_heartbeat(glob_name, 7)
+    assert counter.count() == 7
+    uu.progress.write_heartbeat(glob_name, 8)
+    assert counter.count() == 8
+    assert [p.name for p in tmp_path.iterdir()] == [".ubermag-heartbeat"]
+    (tmp_path / ".ubermag-heartbeat").write_text("corrupt")
+    assert counter.count() == 8  # last valid count is kept
+    counter.close()
+
+
+def test_heartbeat_writer(tmp_path):
+    glob_name = f"{tmp_path}/*.omf"
+    events = []
+    progress = uu.progress.headless(
+        "pkg",
+        "runner",
+        events.append,
+        glob_name=glob_name,
+        backend="heartbeat",
+        min_interval=0,
+    )
+    with uu.progress.heartbeat_writer(glob_name, interval=0.01), progress:
+        for i in range(3):
+            (tmp_path / f"{i}.omf").touch()
+            time.sleep(0.05)
+        time.sleep(0.05)
+    assert events[-1]["count"] == 3
+    assert (tmp_path / ".ubermag-heartbeat").read_text() == "3"
+    assert len(list(tmp_path.glob("*.tmp"))) == 0
+
+
+def test_heartbeat_writer_counts_once(tmp_path, monkeypatch):
+    class Counter:
+        calls = 0
+
+        def count(self):
+            self.calls += 1
+            return self.calls  # changes on every call
+
+        def close(self):
+            pass
+
+    counter = Counter()
+    written = []
+    monkeypatch.setattr(uu.progress, "file_counter", lambda *args: counter)
+    monkeypatch.setattr(
+        uu.progress, "write_heartbeat", lambda glob_name, count: written.append(count)
+    )
+    with uu.progress.heartbeat_writer(f"{tmp_path}/*.omf", interval=0.01):
+        time.sleep(0.05)
+    assert written == list(range(1, counter.calls + 1))
+
+
+def test_stream_counter(tmp_path):
+    code = (
+        "import sys, time\n"
+        "for i in range(1, 11):\n"
+        "    print(f'step {i} of 10', flush=True)\n"
+        "    print('diagnostics', flush=True)\n"
+        "    time.sleep(0.01)\n"
+    )
+    log = tmp_path / "solver.log"
+    popen = subprocess.Popen([sys.executable, "-c", code], stdout=subprocess.PIPE)
+    with popen as proc, open(log, "wb") as tee:
+        counter = uu.progress.StreamCounter(
+            proc.stdout, pattern=re.compile(rb"step (\d+) of"), tee=tee
+        )
+        with uu.progress.bar(
+            10, "my package", "my runner", None, counter=counter, unit="steps"
+        ):
+            proc.wait()
+    assert counter.count() == 10
+    assert log.read_bytes().count(b"diagnostics") == 10
+
+    # counting matches of a pattern without groups and custom parsers
+    stream = io.StringIO("a\nstep\nb\nstep\n")
+    counter = uu.progress.StreamCounter(stream, pattern=re.compile("step"))
+    counter.close()
+    assert counter.count() == 2
+
+    stream = io.StringIO("10%\nfoo\n50%\n")
+    counter = uu.progress.StreamCounter(
+        stream, parser=lambda line: int(line[:-2]) if "%" in line else None
+    )
+    counter.close()
+    assert counter.count() == 50
+
+    with pytest.raises(ValueError):
+        uu.progress.StreamCounter(io.StringIO(), pattern=None)
+
+
+def test_stream_counter_errors(caplog):
+    # the stream is drained after lines which cannot be parsed
+    code = "print('step abc'); print('step 2'); print('x' * 2**20 * 20)"
+    popen = subprocess.Popen([sys.executable, "-c", code], stdout=subprocess.PIPE)
+    with popen as proc:
+        counter = uu.progress.StreamCounter(
+            proc.stdout, pattern=re.compile(rb"step (\w+)")
+        )
+        proc.wait(timeout=10)
+        counter.close()
+    assert counter.count() == 2
+    assert "Cannot parse progress" in caplog.text
+
+    # leaving the bar with an exception does not wait for the end of the output
+    code = "import time; print('step 1', flush=True); time.sleep(60)"
+    popen = subprocess.Popen([sys.executable, "-c", code], stdout=subprocess.PIPE)
+    with popen as proc:
+        counter = uu.progress.StreamCounter(
+            proc.stdout, pattern=re.compile(rb"step (\d+)")
+        )
+        progress_bar = uu.progress.bar(1, "pkg", "runner", None, counter=counter)
+        tic = time.monotonic()
+        try:
+            with pytest.raises(RuntimeError), progress_bar:
+                raise RuntimeError
+        finally:
+            proc.terminate()
+        assert time.monotonic() - tic < 10
+
+
+def test_file_counter_backends(tmp_path):
+    assert isinstance(
+        uu.progress.file_counter(f"{tmp_path}/*/*.omf"), uu.progress.GlobCounter
+    )
+    counter = uu.progress.file_counter(f"{tmp_path}/missing/*.omf")
+    assert isinstance(counter, uu.progress.ScandirCounter)
+    assert counter.count() == 0
+    (tmp_path / "missing").mkdir()
+    (tmp_path / "missing" / "m.omf").touch()
+    assert counter.count() == 1
+    if sys.platform.startswith("linux"):
+        counter = uu.progress.file_counter(f"{tmp_path}/*.omf")
+        assert isinstance(counter, uu.progress.InotifyCounter)
+        counter.close()
+    with pytest.raises(ValueError):
+        uu.progress.file_counter("*.omf", backend="poll")
@@ -0,0 +1,130 @@
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import pytest
+
+import ubermagutil.resources as ur
+
+pytestmark = pytest.mark.skipif(
+    not sys.platform.startswith("linux"), reason="requires /proc"
+)
+
+CHILD = """
+import time
+data = bytearray(100 * 1024**2)
+with open({path!r}, "wb") as f:
+    f.write(b"0" * 10 * 1024**2)
+tic = time.process_time()
+while time.process_time() - tic < 0.3:
+    pass
+"""
+
+
+def test_resource_sampler(tmp_path):
+    sampler = ur.ResourceSampler()
+    assert sampler.usage.samples == 0
+
+    sampler.sample()
+    code = CHILD.format(path=str(tmp_path / "out.bin"))
+    with subprocess.Popen([sys.executable, "-c", code]) as process:
+        while process.poll() is None:
+            sampler.sample()
+            time.sleep(0.02)
+    sampler.sample()
+
+    usage = sampler.usage
+    assert usage.samples > 2
+    assert usage.duration > 0
+    assert usage.cpu_time >= 0.3  # child is counted after it exited
+    assert usage.cpu_peak > 0
+    assert 0 < usage.cpu_avg <= usage.cpu_peak
+    assert usage.rss_peak > 100 * 1024**2
+    assert 0 < usage.rss_avg <= usage.rss_peak
+    assert usage.write_bytes >= 10 * 1024**2
+
+    assert "CPU" in str(usage)
+    assert "MB" in str(usage)
+    assert repr(usage).startswith("ResourceUsage(duration=")
+
+
+def test_resource_sampler_children(tmp_path, monkeypatch):
+    # fake /proc: 10 -> 11 (started by thread 12 of 10) -> 13, unrelated 20
+    processes = {10: (1, [10, 12]), 11: (10, [11]), 13: (11, [13]), 20: (1, [20])}
+    children = {10: "", 12: "11", 11: "13 99", 13: "", 20: ""}  # 99 exited
+    for pid, (ppid, tids) in processes.items():
+        stat = f"{pid} (sim (1)) S {ppid} " + " ".join(["1"] * 30)
+        (tmp_path / str(pid)).mkdir()
+        (tmp_path / str(pid) / "stat").write_text(stat, encoding="utf-8")
+        for tid in tids:
+            (tmp_path / str(pid) / "task" / str(tid)).mkdir(parents=True)
+            path = tmp_path / str(pid) / "task" / str(tid) / "children"
+            path.write_text(children[tid], encoding="utf-8")
+    read = []
+    read_stat = ur._read_stat
+    monkeypatch.setattr(ur, "_PROC", str(tmp_path))
+    monkeypatch.setattr(
+        ur, "_read_stat", lambda pid: read.append(pid) or read_stat(pid)
+    )
+
+    sampler = ur.ResourceSampler(pid=10)
+    read.clear()
+    assert sorted(pid for pid, _, _ in sampler._tree()) == [10, 11, 13]
+    assert 20 not in read  # only the tree is read
+
+    (tmp_path / "10" / "task" / "10" / "children").unlink()  # not supported
+    sampler = ur.ResourceSampler(pid=10)
+    assert sorted(pid for pid, _, _ in sampler._tree()) == [10, 11, 13]
+    assert "20" in read  # all processes are scanned
+
+
+def test_resource_sampler_invalid_pid():
+    with pytest.raises(OSError):
+        ur.ResourceSampler(pid=-1)
+
+
+def allocate():
+    return bytearray(20 * 1024**2)
+
+
+def test_memory():
+    with ur.memory(top=3, interval=0.01) as usage:
+        data = allocate()
+        del data
+        kept = [0] * 10**5
+    assert usage.peak >= 20 * 1024**2  # freed before the end, but in the peak
+    assert len(usage.top) <= 3
+    site, size, count = usage.top[0]
+    assert "test_resources.py:" in site  # allocation of kept
+    assert size >= 8 * len(kept)
+    assert count >= 1
+    assert usage.rss_start > 0
+    assert usage.rss_peak >= usage.rss_end
+    assert usage.rss_delta == usage.rss_end - usage.rss_start
+    assert str(usage).startswith("Python peak ")
+    assert "RSS " in str(usage)
+    assert repr(usage).startswith("MemoryUsage(peak=")
+
+
+def test_memory_options():
+    with ur.memory(nframes=0) as usage:
+        allocate()
+    assert usage.peak is None
+    assert usage.top == []
+    assert usage.rss_peak is None  # not sampled
+    assert str(usage).startswith("RSS ")
+
+    tracemalloc.start()
+    try:
+        before = allocate()
+        with ur.memory() as usage:
+            allocate()
+            kept = [0] * 10**5
+        assert tracemalloc.is_tracing()  # not stopped
+        assert usage.peak >= 20 * 1024**2
+        assert all(size > 0 for _, size, _ in usage.top)
+        assert usage.top[0][1] < len(before)  # only allocations in the block
+    finally:
+        tracemalloc.stop()
+    assert len(kept) == 10**5
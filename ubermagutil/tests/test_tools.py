@@ -1,5 +1,14 @@
+import asyncio
+import concurrent.futures
+import itertools
+import os
 import pathlib
+import pickle
+import subprocess
+import sys
+import time
 
+import numpy as np
 import pytest
 
 import ubermagutil as uu
@@ -30,6 +39,46 @@ def test_hysteresis_values():
     # Exception
     with pytest.raises(ValueError):
         uu.hysteresis_values(-1, 1, 0.3)
+    with pytest.raises(ValueError):
+        uu.hysteresis_values(-1, 1, 0.5, output="tuple")
+
+
+def test_hysteresis_values_array():
+    res = uu.hysteresis_values(-1e-6, 1e-6, 0.01e-6, output="array")
+    assert isinstance(res, np.ndarray)
+    assert res.dtype == np.float64
+    assert res.tolist() == uu.hysteresis_values(-1e-6, 1e-6, 0.01e-6)
+
+    with pytest.raises(ValueError):
+        uu.hysteresis_values(-1, 1, 0.3, output="array")
+
+
+def test_hysteresis_values_lazy():
+    res = uu.hysteresis_values(-1e6, 1e6, 0.1e6, output="lazy")
+    expected = uu.hysteresis_values(-1e6, 1e6, 0.1e6)
+    assert isinstance(res, uu.tools.HysteresisValues)
+    assert len(res) == 41
+    assert list(res) == expected
+    assert [res[i] for i in range(-41, 41)] == expected + expected
+    assert res[5:30:3].tolist() == expected[5:30:3]
+    assert res[::-1].tolist() == expected[::-1]
+    assert np.asarray(res).tolist() == expected
+    assert 0.0 in res
+    assert "HysteresisValues" in repr(res)
+
+    with pytest.raises(IndexError):
+        res[41]
+    with pytest.raises(IndexError):
+        res[-42]
+    with pytest.raises(TypeError):
+        res[1.5]
+    with pytest.raises(ValueError):
+        uu.hysteresis_values(-1, 1, 0.3, output="lazy")
+
+    # memory does not depend on the number of steps
+    res = uu.hysteresis_values(-1, 1, 1e-9, output="lazy")
+    assert len(res) == 4_000_000_001
+    assert abs(res[2_000_000_000] + 1) < 1e-6
 
 
 def test_changedir(tmp_path):
@@ -38,3 +87,347 @@ def test_changedir(tmp_path):
 
     assert (tmp_path / "test.txt").exists()
     assert not (pathlib.Path() / "test.txt").exists()
+
+
+def test_hysteresis_path():
+    res = uu.tools.hysteresis_path(-1, 1, 0.5, direction=(1, 1, 0))
+    values = uu.hysteresis_values(-1, 1, 0.5, output="array")
+    assert res.shape == (9, 3)
+    assert np.allclose(res[:, 0], values / np.sqrt(2))
+    assert np.allclose(res[:, 1], values / np.sqrt(2))
+    assert np.allclose(res[:, 2], 0)
+
+    # minor loop along default z direction
+    res = uu.tools.hysteresis_path(0.2, 1, 0.4)
+    assert np.allclose(
+        res, [[0, 0, 1], [0, 0, 0.6], [0, 0, 0.2], [0, 0, 0.6], [0, 0, 1]]
+    )
+
+    with pytest.raises(ValueError):
+        uu.tools.hysteresis_path(-1, 1, 0.3)
+    with pytest.raises(ValueError):
+        uu.tools.hysteresis_path(-1, 1, 0.5, direction=(0, 0, 0))
+    with pytest.raises(ValueError):
+        uu.tools.hysteresis_path(-1, 1, 0.5, direction=(1, 0))
+
+
+def test_rotation_path():
+    res = uu.tools.rotation_path((2, 0, 0), step=45)
+    assert res.shape == (9, 3)
+    assert np.allclose(np.linalg.norm(res, axis=1), 2)
+    assert np.allclose(res[0], res[-1])
+    assert np.allclose(res[2], [0, 2, 0])
+
+    # conical rotation around x by 180 degrees
+    res = uu.tools.rotation_path((1, 1, 0), step=90, axis=(5, 0, 0), angle=180)
+    assert np.allclose(res, [[1, 1, 0], [1, 0, 1], [1, -1, 0]])
+
+    with pytest.raises(ValueError):
+        uu.tools.rotation_path((1, 0, 0), step=7)
+
+
+def test_waypoint_path():
+    waypoints = [(0, 0, 0), (1, 0, 0), (1, 0, 0), (1, 0.5, 0), (0, 0.5, 0)]
+    res = uu.tools.waypoint_path(waypoints, step=0.25)
+    assert res.shape[1] == 3
+    assert np.allclose(res[:5, 0], [0, 0.25, 0.5, 0.75, 1])
+    for waypoint in waypoints:
+        assert np.any(np.all(np.isclose(res, waypoint), axis=1))
+    assert len(res) == 4 + 2 + 4 + 1
+    assert np.allclose(res[-1], [0, 0.5, 0])
+
+    assert np.allclose(uu.tools.waypoint_path([(1, 2, 3)], step=1), [[1, 2, 3]])
+
+    with pytest.raises(ValueError):
+        uu.tools.waypoint_path(waypoints, step=0.3)
+    with pytest.raises(ValueError):
+        uu.tools.waypoint_path([1, 2, 3], step=1)
+
+
+def test_adaptive_hysteresis_values():
+    def response(value):
+        # smooth switching at +-0.5 depending on the sweep direction
+        return np.tanh(5 * (value + 0.5 * direction))
+
+    step, min_step = 0.2, 0.01
+    sweep = uu.tools.adaptive_hysteresis_values(
+        -2, 2, step, tolerance=0.1, min_step=min_step, max_step=1
+    )
+    values = [next(sweep)]
+    direction = 1
+    while True:
+        try:
+            value = sweep.send(response(values[-1]))
+        except StopIteration:
+            break
+        if value > values[-1]:
+            direction = -1
+        values.append(value)
+
+    values = np.array(values)
+    assert values[0] == values[-1] == 2
+    assert -2 in values
+    turn = np.argmin(values)
+    assert np.all(np.diff(values[: turn + 1]) < 0)
+    assert np.all(np.diff(values[turn:]) > 0)
+    steps = np.abs(np.diff(values))
+    assert np.all(steps <= 1 + 1e-12)
+    assert np.all(steps[:-1] >= min_step - 1e-12)  # last step can be clipped
+    # far fewer values than with a fixed minimum step, refined at switching
+    assert len(values) < len(uu.hysteresis_values(-2, 2, min_step)) / 4
+    assert np.sum(np.abs(values + 0.7) < 0.3) > np.sum(np.abs(values - 1.5) < 0.3)
+
+    # without responses, the step is fixed
+    assert list(uu.tools.adaptive_hysteresis_values(-1, 1, 0.5, 1)) == [
+        1.0,
+        0.5,
+        0.0,
+        -0.5,
+        -1.0,
+        -0.5,
+        0.0,
+        0.5,
+        1.0,
+    ]
+
+    # array responses
+    sweep = uu.tools.AdaptiveHysteresisValues(-1, 1, 0.5, 0.1, max_step=2)
+    values = []
+    for value in sweep:
+        values.append(value)
+        sweep.respond(np.array([0, 0, 1]))
+    assert values == [1.0, 0.5, -0.5, -1.0, 1.0]
+
+    for args in [(1, -1, 0.1, 1), (-1, 1, -0.1, 1), (-1, 1, 0.1, 0)]:
+        with pytest.raises(ValueError):
+            next(uu.tools.adaptive_hysteresis_values(*args))
+    with pytest.raises(ValueError):
+        next(uu.tools.adaptive_hysteresis_values(-1, 1, 0.1, 1, min_step=0.2))
+    with pytest.raises(ValueError):
+        next(uu.tools.adaptive_hysteresis_values(-1, 1, 0.1, 1, factor=1))
+
+
+def test_checkpointed_sweep(tmp_path):
+    journal = tmp_path / "sweep.json"
+    values = uu.hysteresis_values(-1, 1, 0.5, output="lazy")
+
+    done = []
+    with pytest.raises(RuntimeError):
+        for index, value in uu.tools.CheckpointedSweep(values, journal):
+            if index == 3:
+                raise RuntimeError("simulated crash")
+            done.append(value)
+    assert done == list(values[:3])
+    assert journal.exists()
+    assert not (tmp_path / "sweep.json.tmp").exists()
+
+    sweep = uu.tools.CheckpointedSweep(values, journal)
+    assert sweep.completed == [0, 1, 2]
+    assert sweep.remaining == list(range(3, 9))
+    assert [index for index, _ in sweep] == list(range(3, 9))
+    assert sweep.completed == list(range(9))
+    assert "CheckpointedSweep" in repr(sweep)
+
+    # restarting a finished sweep does nothing
+    assert list(uu.tools.CheckpointedSweep(values, journal)) == []
+
+    # non-lazy values and breaking out of the loop
+    journal = tmp_path / "list.json"
+    values = [0.1, 0.2, 0.3]
+    for _index, value in uu.tools.CheckpointedSweep(values, journal):
+        if value == 0.2:
+            break
+    assert list(uu.tools.CheckpointedSweep(values, journal)) == [(1, 0.2), (2, 0.3)]
+
+    with pytest.raises(ValueError):
+        uu.tools.CheckpointedSweep([0.1, 0.2], journal)
+    with pytest.raises(ValueError):
+        uu.tools.CheckpointedSweep(uu.tools.HysteresisValues(-1, 1, 0.1), journal)
+
+    # numpy scalar parameters and a line left incomplete by a crash
+    journal = tmp_path / "numpy.json"
+    values = uu.tools.HysteresisValues(np.int64(-1), np.int64(1), np.float64(0.5))
+    sweep = uu.tools.CheckpointedSweep(values, journal)
+    sweep.mark_completed(0)
+    sweep.mark_completed(1)
+    with journal.open("a", encoding="utf-8") as f:
+        f.write("2")  # crash before the newline was written
+    assert list(tmp_path.glob("*.tmp")) == []
+    sweep = uu.tools.CheckpointedSweep(values, journal)
+    assert sweep.completed == [0, 1]
+    sweep.mark_completed(2)
+    assert journal.read_text().splitlines()[1:] == ["0", "1", "2", "2"]
+    assert uu.tools.CheckpointedSweep(values, journal).completed == [0, 1, 2]
+
+    # sweep grid with a numpy axis
+    journal = tmp_path / "grid.json"
+    field = uu.tools.HysteresisValues(-1, 1, 1)
+    grid = uu.tools.SweepGrid(H=field, T=np.array([0, 300]), mode=["a", np.str_("b")])
+    for index, _point in uu.tools.CheckpointedSweep(grid, journal):
+        if index == 3:
+            break
+    sweep = uu.tools.CheckpointedSweep(grid, journal)
+    assert sweep.definition["grid"]["H"] == {"vmin": -1.0, "vmax": 1.0, "step": 1.0}
+    assert sweep.completed == [0, 1, 2]
+    assert next(iter(sweep)) == (3, grid[3])
+    grid = uu.tools.SweepGrid(H=field, T=np.array([0, 100]), mode=["a", "b"])
+    with pytest.raises(ValueError):
+        uu.tools.CheckpointedSweep(grid, journal)
+
+
+def test_sweep_grid():
+    field = uu.hysteresis_values(-1, 1, 0.5, output="lazy")
+    grid = uu.tools.SweepGrid(H=field, T=np.array([0, 100, 300]), mode=["a", "b"])
+    assert grid.names == ("H", "T", "mode")
+    assert grid.shape == (9, 3, 2)
+    assert len(grid) == 54
+    assert "SweepGrid" in repr(grid)
+
+    expected = [
+        {"H": H, "T": T, "mode": mode}
+        for H, T, mode in itertools.product(field, [0, 100, 300], ["a", "b"])
+    ]
+    assert list(grid) == expected
+    assert [grid[i] for i in range(len(grid))] == expected
+    assert grid[-1] == expected[-1]
+    assert list(grid[7]) == ["H", "T", "mode"]
+
+    with pytest.raises(IndexError):
+        grid[54]
+    with pytest.raises(IndexError):
+        grid[-55]
+
+    for n in [1, 5, 7, 54, 100]:
+        chunks = grid.chunks(n)
+        assert len(chunks) == min(n, len(grid))
+        sizes = [len(chunk) for chunk in chunks]
+        assert max(sizes) - min(sizes) <= 1
+        assert [i for chunk in chunks for i in chunk] == list(range(len(grid)))
+    with pytest.raises(ValueError):
+        grid.chunks(0)
+
+    # grid and chunks can be sent to worker processes
+    clone = pickle.loads(pickle.dumps(grid))
+    assert [clone[i] for i in grid.chunks(4)[1]] == expected[14:28]
+
+    with pytest.raises(ValueError):
+        uu.tools.SweepGrid()
+
+
+def test_workdir(tmp_path):
+    cwd = os.getcwd()
+    assert uu.tools.current_workdir() == pathlib.Path(cwd)
+    with uu.tools.workdir(tmp_path) as path:
+        assert path == tmp_path
+        assert os.getcwd() == cwd
+        assert uu.tools.current_workdir() == tmp_path
+        assert uu.tools.resolve_path("a.txt") == tmp_path / "a.txt"
+        assert uu.tools.resolve_path(tmp_path / "b") == tmp_path / "b"
+        (tmp_path / "sub").mkdir()
+        with uu.tools.workdir("sub") as subpath:
+            assert subpath == tmp_path / "sub"
+            subprocess.run(
+                [sys.executable, "-c", "open('out.txt', 'w').close()"],
+                cwd=uu.tools.current_workdir(),
+                check=True,
+            )
+        assert uu.tools.current_workdir() == tmp_path
+    assert uu.tools.current_workdir() == pathlib.Path(cwd)
+    assert (tmp_path / "sub" / "out.txt").exists()
+
+
+def test_workdir_concurrent(tmp_path):
+    async def run(name):
+        with uu.tools.workdir(tmp_path / name):
+            await asyncio.sleep(0.01)
+            return uu.tools.current_workdir()
+
+    async def main():
+        return await asyncio.gather(*(run(str(i)) for i in range(5)))
+
+    assert asyncio.run(main()) == [tmp_path / str(i) for i in range(5)]
+
+    def thread_run(name):
+        with uu.tools.workdir(tmp_path / name):
+            time.sleep(0.01)
+            return uu.tools.current_workdir()
+
+    with concurrent.futures.ThreadPoolExecutor(4) as executor:
+        results = list(executor.map(thread_run, "abcd"))
+    assert results == [tmp_path / name for name in "abcd"]
+
+
+def test_scratchdir(tmp_path):
+    destination = tmp_path / "drive-0"
+    scratch_root = tmp_path / "shm"
+    scratch_root.mkdir()
+    cwd = os.getcwd()
+    with uu.tools.scratchdir(
+        destination, patterns=["*.odt", "**/*.omf"], scratch_root=scratch_root
+    ) as path:
+        assert path.parent == scratch_root
+        assert os.getcwd() == str(path)
+        pathlib.Path("m.odt").write_text("table", encoding="utf-8")
+        pathlib.Path("m.log").write_text("log", encoding="utf-8")
+        pathlib.Path("fields").mkdir()
+        for i in range(5):
+            pathlib.Path(f"fields/m{i}.omf").write_text(str(i), encoding="utf-8")
+    assert os.getcwd() == cwd
+    assert list(scratch_root.iterdir()) == []
+    assert (destination / "m.odt").read_text(encoding="utf-8") == "table"
+    assert not (destination / "m.log").exists()
+    assert len(list((destination / "fields").glob("*.omf"))) == 5
+
+    # copy-in, parallel copy-back, and cleanup after an exception
+    scratchdir = uu.tools.scratchdir(
+        destination,
+        copy_in=["*.odt"],
+        scratch_root=scratch_root,
+        threads=4,
+        chdir=False,
+    )
+    with pytest.raises(RuntimeError), scratchdir as path:
+        assert os.getcwd() == cwd
+        assert uu.tools.current_workdir() == path
+        assert (path / "m.odt").exists()
+        for i in range(10):
+            (path / f"{i}.txt").write_text(str(i), encoding="utf-8")
+        raise RuntimeError
+    assert list(scratch_root.iterdir()) == []
+    assert len(list(destination.glob("*.txt"))) == 10
+
+
+def test_scratchdir_copy_back(tmp_path, monkeypatch, caplog):
+    destination = tmp_path / "drive"
+    scratch_root = tmp_path / "shm"
+    scratch_root.mkdir()
+    with uu.tools.scratchdir(destination, scratch_root=scratch_root):
+        pathlib.Path("top.txt").write_text("top", encoding="utf-8")
+        pathlib.Path("sub").mkdir()
+        pathlib.Path("sub/x.omf").write_text("x", encoding="utf-8")
+    assert (destination / "top.txt").exists()
+    assert (destination / "sub" / "x.omf").exists()
+
+    def copy2(source, target):
+        raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr(uu.tools.shutil, "copy2", copy2)
+    scratchdir = uu.tools.scratchdir(destination, scratch_root=scratch_root)
+    with pytest.raises(OSError), scratchdir as path:
+        (path / "result.txt").write_text("result", encoding="utf-8")
+    assert (path / "result.txt").read_text(encoding="utf-8") == "result"
+    assert str(path) in caplog.text
+
+
+def test_scratchdir_fallback(tmp_path, caplog):
+    with uu.tools.scratchdir(
+        tmp_path / "drive", scratch_root=tmp_path, max_size=2**70
+    ) as path:
+        assert path == tmp_path / "drive"
+        assert os.getcwd() == str(path)
+    assert "Cannot use scratch directory" in caplog.text
+
+    with uu.tools.scratchdir(
+        tmp_path / "drive", scratch_root=tmp_path / "missing", chdir=False
+    ) as path:
+        assert path == tmp_path / "drive"
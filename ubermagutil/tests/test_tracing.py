@@ -0,0 +1,111 @@
+import asyncio
+import json
+import threading
+
+import pytest
+
+import ubermagutil as uu
+import ubermagutil.tracing as ut
+
+
+@pytest.fixture
+def tracing():
+    ut.clear()
+    ut.enable()
+    yield
+    ut.disable()
+    ut.clear()
+
+
+def spans():
+    return {
+        event["name"]: event
+        for event in ut.chrome_trace()["traceEvents"]
+        if event["ph"] == "X"
+    }
+
+
+def test_disabled():
+    ut.clear()
+    assert not ut.is_enabled()
+    assert ut.span("a") is ut.span("b")  # shared no-op span
+    with ut.span("a"):
+        pass
+
+    @ut.traced
+    def f(x):
+        return 2 * x
+
+    assert f(2) == 4
+    assert spans() == {}
+
+
+def test_span(tracing):
+    with ut.span("outer", n=3):
+        with ut.span("inner"):
+            pass
+        with pytest.raises(ValueError), ut.span("failing"):
+            raise ValueError
+
+    events = spans()
+    assert events["outer"]["args"] == {"n": 3}
+    assert events["failing"]["args"] == {"error": "ValueError"}
+    outer, inner = events["outer"], events["inner"]
+    assert outer["ts"] <= inner["ts"]
+    assert inner["ts"] + inner["dur"] <= outer["ts"] + outer["dur"]
+
+    header, *lines = ut.report().splitlines()
+    assert header.split()[:2] == ["span", "calls"]
+    assert lines[0].split()[:2] == ["outer", "1"]
+    assert sorted(line.split()[0] for line in lines[1:]) == ["failing", "inner"]
+    assert all(line.startswith("  ") for line in lines[1:])
+
+
+def test_threads_tasks(tracing):
+    def work(i):
+        with ut.span(f"thread {i}"):
+            pass
+
+    for i in range(2):  # the ident of the first thread is usually reused
+        thread = threading.Thread(target=work, args=(i,))
+        thread.start()
+        thread.join()
+
+    @ut.traced(name="task")
+    async def task(i):
+        with ut.span(f"task {i}"):
+            await asyncio.sleep(0.01)
+
+    async def main():
+        with ut.span("main"):
+            await asyncio.gather(task(0), task(1))
+
+    asyncio.run(main())
+
+    events = spans()
+    assert events["thread 0"]["tid"] != events["thread 1"]["tid"]
+    assert events["task 0"]["tid"] != events["task 1"]["tid"]
+    names = [
+        event["args"]["name"]
+        for event in ut.chrome_trace()["traceEvents"]
+        if event["name"] == "thread_name"
+    ]
+    assert len(names) == 5  # two threads, main task and two gathered tasks
+    report = ut.report()
+    assert "\n  task " in report  # tasks are children of main
+    assert "\n    task 0 " in report
+
+
+def test_write_chrome_trace(tracing, tmp_path):
+    with uu.progress.summary("pkg", "runner"), ut.span("write input"):
+        pass
+    with uu.progress.bar(1, "pkg", "bar", f"{tmp_path}/*.out"):
+        pass
+
+    ut.write_chrome_trace(tmp_path / "trace.json")
+    with open(tmp_path / "trace.json", encoding="utf-8") as f:
+        trace = json.load(f)
+    names = [event["name"] for event in trace["traceEvents"] if event["ph"] == "X"]
+    assert names == ["write input", "pkg (runner)", "pkg (bar)"]
+    assert "pkg (runner)" in ut.report()
+    assert "\n  write input" in ut.report()
@@ -1,3 +1,6 @@
+import numpy as np
+import pytest
+
 import ubermagutil.units as uu
 
 
@@ -25,3 +28,122 @@ def test_si_max_multiplier():
     assert uu.si_max_multiplier(values) == 1
     values = (1, 1e3, 1e6)
     assert uu.si_max_multiplier(values) == 1e6
+
+
+def test_si_format():
+    assert uu.si_format(5e-9, "m") == "5.0 nm"
+    assert uu.si_format(0, "m") == "0.0 m"
+    assert uu.si_format(5, "") == "5.0"
+
+    res = uu.si_format([5e-9, 50e-9, 5000e-9], "m")
+    assert isinstance(res, np.ndarray)
+    assert res.tolist() == ["0.0 um", "0.1 um", "5.0 um"]
+
+    res = uu.si_format([5e-9, -50e-9, 5000e-9], "m", shared=False)
+    assert res.tolist() == ["5.0 nm", "-50.0 nm", "5.0 um"]
+
+    res = uu.si_format(np.full((3, 2), 250e-3), "T", precision=0)
+    assert res.shape == (3, 2)
+    assert np.all(res == "250 mT")
+
+    # consistency with si_multiplier
+    values = [1e-9, 100e-9, 1001e-9, 0.5e-9, 0.05, 500, 1e3]
+    for value, string in zip(values, uu.si_format(values, "m", shared=False)):
+        prefix = uu.rsi_prefixes[uu.si_multiplier(value)]
+        assert string.endswith(f" {prefix}m")
+
+    assert uu.si_format([], "m").size == 0
+
+
+def test_si_parse():
+    assert uu.si_parse("250 mT") == (0.25, "T")
+    assert uu.si_parse("5e-9 m") == (5e-9, "m")
+    assert uu.si_parse("-3ns") == (-3e-9, "s")
+    assert uu.si_parse("2 µm") == (2e-6, "m")
+    assert uu.si_parse("7") == (7, "")
+    assert uu.si_parse("5 mol", unit="mol") == (5, "mol")
+    assert uu.si_parse("100 Pa", unit="Pa") == (100, "Pa")
+    assert uu.si_parse("100 Pa") == (100, "Pa")
+    assert uu.si_parse("2 mol") == (2, "mol")
+    assert uu.si_parse("1 min") == (1, "min")
+    assert uu.si_parse("3 kmol") == (3000, "mol")
+    assert uu.si_parse("1 MJ/m3") == (1e6, "J/m3")
+    assert uu.si_parse("4 Xyz") == (4, "Xyz")
+    with pytest.raises(ValueError):
+        uu.si_parse("2 mXyz")  # millixyz or unit mXyz
+
+    values, units = uu.si_parse(["250 mT", "5e-9 m", "3 ns", "1.5 kA/m"])
+    assert isinstance(values, np.ndarray)
+    assert np.allclose(values, [0.25, 5e-9, 3e-9, 1.5e3])
+    assert units.tolist() == ["T", "m", "s", "A/m"]
+
+    values, units = uu.si_parse(np.array([["1 mT", "2 mT"], ["3 T", "4 kT"]]))
+    assert values.shape == units.shape == (2, 2)
+    assert np.allclose(values, [[1e-3, 2e-3], [3, 4e3]])
+
+    values, units = uu.si_parse(f"{i} nm" for i in range(3))
+    assert np.allclose(values, [0, 1e-9, 2e-9])
+
+    # round trip
+    strings = uu.si_format([5e-9, 50e-9, 5000e-9], "m", shared=False, precision=3)
+    assert np.allclose(uu.si_parse(strings)[0], [5e-9, 50e-9, 5000e-9])
+
+    assert uu.si_parse([])[0].size == 0
+
+    # strings without a space or with tabs are parsed with the regex fallback
+    values, units = uu.si_parse(["3ns", " 1 \tmT ", "2\tkm", "4  us"])
+    assert np.allclose(values, [3e-9, 1e-3, 2e3, 4e-6])
+    assert units.tolist() == ["s", "T", "m", "s"]
+
+    for invalid in ["abc", "1 m\n2 m", "", "nan m", "1_000 m", "1 m s", "1e m"]:
+        with pytest.raises(ValueError):
+            uu.si_parse(invalid)
+        with pytest.raises(ValueError):
+            uu.si_parse(["1 m", invalid])
+    with pytest.raises(ValueError):
+        uu.si_parse("5 kg", unit="mol")
+
+
+def test_si_rescale():
+    values = np.array([5e-9, -50e-9, 500e-9])
+    rescaled, multiplier = uu.si_rescale(values)
+    assert multiplier == uu.si_max_multiplier(values) == 1e-9
+    assert rescaled is not values
+    assert np.allclose(rescaled, [5, -50, 500])
+    assert np.allclose(values, [5e-9, -50e-9, 500e-9])
+
+    out = np.empty_like(values)
+    rescaled, multiplier = uu.si_rescale(values, out=out)
+    assert rescaled is out
+    assert np.allclose(out, [5, -50, 500])
+
+    rescaled, multiplier = uu.si_rescale(values, out=values)
+    assert rescaled is values
+    assert np.allclose(values, [5, -50, 500])
+
+    rescaled, multiplier = uu.si_rescale([1, 2, 3], multiplier=1e-3)
+    assert multiplier == 1e-3
+    assert np.allclose(rescaled, [1e3, 2e3, 3e3])
+
+    assert uu.si_rescale(np.zeros(3))[1] == 1
+    assert uu.si_rescale(np.array([]))[1] == 1
+
+
+def test_si_scaled_view():
+    values = np.linspace(0, 2e-6, 21).reshape(3, 7)
+    view = uu.SIScaledView(values, unit="m")
+    assert view.multiplier == 1e-6
+    assert view.label == "um"
+    assert view.shape == (3, 7)
+    assert view.ndim == 2
+    assert len(view) == 3
+    assert view.values is values
+    assert np.allclose(view[0, 1:3], [0.1, 0.2])
+    assert np.allclose(next(iter(view)), values[0] / 1e-6)
+    assert np.allclose(np.asarray(view), values / 1e-6)
+    assert "SIScaledView" in repr(view)
+
+    view = uu.SIScaledView([1, 2], unit="T", multiplier=1e-3)
+    assert view.label == "mT"
+    assert view.dtype == np.float64
+    assert np.allclose(view[:], [1e3, 2e3])
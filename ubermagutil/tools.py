@@ -1,17 +1,153 @@
 """Additional tools."""
 
+import collections.abc
+import concurrent.futures
 import contextlib
+import contextvars
+import functools
+import hashlib
+import itertools
+import json
+import logging
+import math
+import operator
 import os
+import pathlib
+import shutil
+import tempfile
 
 import numpy as np
 
+log = logging.getLogger(__name__)
 
-def hysteresis_values(vmin, vmax, step):
+
+class HysteresisValues(collections.abc.Sequence):
+    """Lazy sequence of hysteresis values.
+
+    Values are not stored but computed arithmetically from their integer index
+    (in the same way as ``numpy.arange``), so that the memory required does not
+    depend on the number of steps. Integer indexing and iteration return
+    floats, slicing returns ``numpy.ndarray``. Instances are usually created by
+    ``ubermagutil.hysteresis_values`` with ``output='lazy'``.
+
+    Parameters
+    ----------
+    vmin : numbers.Real
+
+        Minimum value
+
+    vmax : numbers.Real
+
+        Maximum value
+
+    step : numbers.Real
+
+        Step value
+
+    Raises
+    ------
+    ValueError
+
+        If ``vmax - vmin`` range cannot be divided into integer number of
+        steps.
+
+    Examples
+    --------
+    1. Lazy hysteresis values.
+
+    >>> import ubermagutil as uu
+    ...
+    >>> values = uu.hysteresis_values(-1, 1, 0.5, output='lazy')
+    >>> len(values)
+    9
+    >>> values[0], values[4], values[-1]
+    (1.0, -1.0, 1.0)
+    >>> values[::4]
+    array([ 1., -1.,  1.])
+
+    """
+
+    def __init__(self, vmin, vmax, step):
+        self.vmin, self.vmax, self.step = vmin, vmax, step
+        self._ndown, self._nup = _hysteresis_lengths(vmin, vmax, step)
+        # Same increments as used internally by numpy.arange.
+        self._ddown = float((vmax - step) - vmax)
+        self._dup = float((vmin + step) - vmin)
+
+    def __len__(self):
+        return self._ndown + self._nup
+
+    def _values(self, indices):
+        indices = np.asarray(indices)
+        return np.where(
+            indices < self._ndown,
+            self.vmax + indices * self._ddown,
+            self.vmin + (indices - self._ndown) * self._dup,
+        )
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return self._values(np.arange(*key.indices(len(self))))
+        index = operator.index(key)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("Hysteresis values index out of range.")
+        if index < self._ndown:
+            return float(self.vmax + index * self._ddown)
+        return float(self.vmin + (index - self._ndown) * self._dup)
+
+    def __iter__(self):
+        for i in range(self._ndown):
+            yield float(self.vmax + i * self._ddown)
+        for i in range(self._nup):
+            yield float(self.vmin + i * self._dup)
+
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray(self._values(np.arange(len(self))), dtype=dtype)
+
+    def __repr__(self):
+        return (
+            f"{self.__class__.__name__}(vmin={self.vmin}, vmax={self.vmax},"
+            f" step={self.step})"
+        )
+
+
+def _hysteresis_lengths(vmin, vmax, step):
+    """Check ``step`` and return the lengths of the descending and ascending parts.
+
+    The lengths are identical to the ones of the two ``numpy.arange`` calls in
+    ``hysteresis_values``.
+
+    """
+    _check_steps(vmax - vmin, step)
+    return (
+        max(math.ceil((vmin - vmax) / -step), 0),
+        max(math.ceil((vmax + _RTOL * step - vmin) / step), 0),
+    )
+
+
+_RTOL = 1e-3
+
+
+def _check_steps(length, step):
+    """Raise ``ValueError`` if ``length`` is not an integer number of ``step``."""
+    rem = length % step
+    if _RTOL * step < rem < step - _RTOL * step:
+        msg = "Value range cannot be divided into integer number of steps."
+        raise ValueError(msg)
+
+
+def hysteresis_values(vmin, vmax, step, output="list"):
     """Generate hysteresis values.
 
     Given ``vmin``, ``vmax``, and ``step``, hysteresis loop values are
-    generated and ``list`` is returned. The first and the last values in the
-    result are ``vmax``.
+    generated. The first and the last values in the result are ``vmax``.
+
+    By default, a ``list`` is returned. For long sweeps, ``output='array'``
+    returns a ``numpy.ndarray`` (avoiding the conversion to Python floats) and
+    ``output='lazy'`` returns a ``ubermagutil.tools.HysteresisValues`` sequence,
+    which computes values on access and does not store them.
 
     If ``vmax - vmin`` range cannot be divided into integer number of steps,
     ``ValueError`` is raised.
@@ -30,9 +166,14 @@ def hysteresis_values(vmin, vmax, step):
 
         Step value
 
+    output : str, optional
+
+        Type of the result: ``'list'``, ``'array'``, or ``'lazy'``. Defaults to
+        ``'list'``.
+
     Returns
     -------
-    list
+    list, numpy.ndarray, ubermagutil.tools.HysteresisValues
 
         Hysteresis values.
 
@@ -41,7 +182,7 @@ def hysteresis_values(vmin, vmax, step):
     ValueError
 
         If ``vmax - vmin`` range cannot be divided into integer number of
-        steps.
+        steps or if ``output`` is invalid.
 
     Examples
     --------
@@ -51,17 +192,644 @@ def hysteresis_values(vmin, vmax, step):
     ...
     >>> uu.hysteresis_values(-1, 1, 1)
     [1.0, 0.0, -1.0, 0.0, 1.0]
+    >>> uu.hysteresis_values(-1, 1, 1, output='array')
+    array([ 1.,  0., -1.,  0.,  1.])
 
     """
-    rtol = 1e-3
-    rem = (vmax - vmin) % step
-    if rtol * step < rem < step - rtol * step:
-        msg = "Value range cannot be divided into integer number of steps."
+    if output not in ("list", "array", "lazy"):
+        msg = f"Unknown {output=}; use 'list', 'array', or 'lazy'."
+        raise ValueError(msg)
+
+    values = HysteresisValues(vmin, vmax, step)
+    if output == "lazy":
+        return values
+    elif output == "array":
+        return np.asarray(values)
+    else:
+        return np.asarray(values).tolist()
+
+
+def adaptive_hysteresis_values(
+    vmin, vmax, step, tolerance, min_step=None, max_step=None, factor=2
+):
+    """Generate hysteresis values with steps adapted to the response.
+
+    Like ``ubermagutil.hysteresis_values``, values go from ``vmax`` to ``vmin``
+    and back to ``vmax``, but the step is adapted based on the measured
+    response (e.g. the average magnetisation) sent to the generator. The next
+    step is chosen so that the response is expected to change by ``tolerance``,
+    based on the rate of change between the last two values. If the response
+    changed by more than ``tolerance``, the step is divided by at least
+    ``factor``. The step grows by at most ``factor`` per value and always stays
+    within ``min_step`` and ``max_step``. The response can be a number or an
+    array, in which case the norm of the change is used. Values are never
+    revisited, so the history of the simulated system is preserved. Both
+    ``vmin`` and ``vmax`` are always part of the sweep.
+
+    The response to the most recent value is passed with ``send``, which
+    returns the next value (``StopIteration`` is raised at the end of the
+    sweep). Values requested with ``next`` (e.g. in a ``for`` loop) do not
+    change the step. For a ``for`` loop with responses, use
+    ``ubermagutil.tools.AdaptiveHysteresisValues``.
+
+    Parameters
+    ----------
+    vmin : numbers.Real
+
+        Minimum value
+
+    vmax : numbers.Real
+
+        Maximum value
+
+    step : numbers.Real
+
+        Initial step value.
+
+    tolerance : numbers.Real
+
+        Change of the response above which the step is refined.
+
+    min_step : numbers.Real, optional
+
+        Minimum step value. Defaults to ``step / 10``.
+
+    max_step : numbers.Real, optional
+
+        Maximum step value. Defaults to ``10 * step``.
+
+    factor : numbers.Real, optional
+
+        Factor by which the step is refined or coarsened. Defaults to ``2``.
+
+    Yields
+    ------
+    float
+
+        Hysteresis values.
+
+    Raises
+    ------
+    ValueError
+
+        If ``vmin >= vmax`` or the steps, ``tolerance``, or ``factor`` are
+        invalid.
+
+    Examples
+    --------
+    1. Adaptive sweep with a response switching between -1 and 1 at -0.5.
+
+    >>> import ubermagutil as uu
+    ...
+    >>> sweep = uu.tools.adaptive_hysteresis_values(
+    ...     -1, 1, 0.5, tolerance=0.5, min_step=0.125
+    ... )
+    >>> values = [next(sweep)]
+    >>> while True:
+    ...     response = 1.0 if values[-1] > -0.5 else -1.0  # run simulation
+    ...     try:
+    ...         values.append(sweep.send(response))
+    ...     except StopIteration:
+    ...         break
+    >>> values
+    [1.0, 0.5, -0.5, -0.75, -1.0, 0.0, 0.25, 0.75, 1.0]
+
+    """
+    min_step = step / 10 if min_step is None else min_step
+    max_step = 10 * step if max_step is None else max_step
+    if vmin >= vmax:
+        raise ValueError(f"Minimum value {vmin} must be smaller than {vmax}.")
+    if not 0 < min_step <= step <= max_step:
+        msg = f"Steps must satisfy 0 < {min_step=} <= {step=} <= {max_step=}."
+        raise ValueError(msg)
+    if tolerance <= 0 or factor <= 1:
+        msg = f"Expected {tolerance=} > 0 and {factor=} > 1."
+        raise ValueError(msg)
+
+    value, direction = float(vmax), -1
+    previous = None  # (value, response)
+    while True:
+        response = yield value
+        if response is not None:
+            if previous is not None:
+                change = np.linalg.norm(np.subtract(response, previous[1]))
+                # Step for which the change is expected to equal ``tolerance``.
+                estimate = (
+                    tolerance * abs(value - previous[0]) / change
+                    if change > 0
+                    else max_step
+                )
+                if change > tolerance:
+                    step = min(step / factor, estimate)
+                else:
+                    step = min(step * factor, estimate, max_step)
+                step = float(max(step, min_step))
+            previous = value, response
+
+        if direction == 1 and value == vmax:
+            return
+        value += direction * step
+        if direction == -1 and value <= vmin + _RTOL * step:
+            value, direction = float(vmin), 1
+        elif direction == 1 and value >= vmax - _RTOL * step:
+            value = float(vmax)
+
+
+class AdaptiveHysteresisValues:
+    """Iterator over adaptive hysteresis values for use in a ``for`` loop.
+
+    Wraps ``ubermagutil.tools.adaptive_hysteresis_values`` (which takes the
+    same parameters). The response to the current value is passed with
+    ``respond`` inside the loop body and used for choosing the next value.
+
+    Examples
+    --------
+    1. Adaptive sweep with a response switching between -1 and 1 at -0.5.
+
+    >>> import ubermagutil as uu
+    ...
+    >>> sweep = uu.tools.AdaptiveHysteresisValues(
+    ...     -1, 1, 0.5, tolerance=0.5, min_step=0.125
+    ... )
+    >>> values = []
+    >>> for value in sweep:
+    ...     values.append(value)
+    ...     sweep.respond(1.0 if value > -0.5 else -1.0)
+    >>> values
+    [1.0, 0.5, -0.5, -0.75, -1.0, 0.0, 0.25, 0.75, 1.0]
+
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._generator = adaptive_hysteresis_values(*args, **kwargs)
+        self._started = False
+        self._response = None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if not self._started:
+            self._started = True
+            return next(self._generator)
+        response, self._response = self._response, None
+        return self._generator.send(response)
+
+    def respond(self, response):
+        """Set the response to the current value."""
+        self._response = response
+
+
+def _json_numpy(value):
+    """Convert numpy scalars and arrays for ``json.dumps``."""
+    if isinstance(value, (np.generic, np.ndarray)):
+        return value.tolist()
+    msg = f"Object of type {type(value).__name__} is not JSON serializable."
+    raise TypeError(msg)
+
+
+def _sweep_definition(values):
+    """JSON-serialisable definition of sweep values for ``CheckpointedSweep``."""
+    if isinstance(values, HysteresisValues):
+        return {
+            "vmin": float(values.vmin),
+            "vmax": float(values.vmax),
+            "step": float(values.step),
+        }
+    if isinstance(values, SweepGrid):
+        return {
+            "grid": {
+                name: _sweep_definition(axis) for name, axis in values.axes.items()
+            }
+        }
+    digest = hashlib.sha256()
+    for value in values:  # one by one, lazy sequences are not materialised
+        digest.update(json.dumps(value, default=_json_numpy).encode() + b"\n")
+    return {"length": len(values), "sha256": digest.hexdigest()}
+
+
+class CheckpointedSweep:
+    """Resumable sweep over values with an on-disk journal.
+
+    Iterating yields ``(index, value)`` tuples. A value is marked as completed
+    in the journal file ``journal`` once the body of the loop finished for it,
+    i.e. when the next value is requested. Values for which the loop body
+    raised an exception, or after which the loop was left with ``break``, are
+    not marked. When a new ``CheckpointedSweep`` with the same values is
+    created with an existing journal (e.g. after a crashed run was restarted),
+    completed values are skipped.
+
+    The journal is a JSON lines file. The first line contains the definition
+    of the sweep and is written atomically. Every completed index is appended
+    as a separate line and synced to disk, so that updating the journal does
+    not depend on the number of values. A line left incomplete by a crash is
+    ignored.
+
+    Parameters
+    ----------
+    values : collections.abc.Sequence
+
+        Sweep values, e.g. the result of ``ubermagutil.hysteresis_values``.
+        ``ubermagutil.tools.HysteresisValues`` are stored in the journal by
+        their parameters, ``ubermagutil.tools.SweepGrid`` by the definitions of
+        their axes, and other sequences by their length and a hash of their
+        values.
+
+    journal : str, pathlib.Path
+
+        Path of the journal file.
+
+    Raises
+    ------
+    ValueError
+
+        If the existing journal belongs to a different sweep.
+
+    Examples
+    --------
+    1. Resume a sweep.
+
+    >>> import os
+    >>> import tempfile
+    >>> import ubermagutil as uu
+    ...
+    >>> journal = os.path.join(tempfile.mkdtemp(), 'sweep.json')
+    >>> values = uu.hysteresis_values(-1, 1, 1)
+    >>> for index, value in uu.tools.CheckpointedSweep(values, journal):
+    ...     if index == 2:
+    ...         break  # simulated crash
+    >>> sweep = uu.tools.CheckpointedSweep(values, journal)
+    >>> sweep.completed
+    [0, 1]
+    >>> list(sweep)
+    [(2, -1.0), (3, 0.0), (4, 1.0)]
+    >>> len(sweep.remaining)
+    0
+
+    """
+
+    def __init__(self, values, journal):
+        self.values = values
+        self.journal = pathlib.Path(journal)
+        self._completed = set()
+        self._newline = False  # last line was left incomplete
+        if self.journal.exists():
+            with self.journal.open(encoding="utf-8") as f:
+                content = f.read()
+            header, *lines = content.splitlines() or ["null"]
+            if json.loads(header) != {"definition": self.definition}:
+                msg = f"Journal {str(self.journal)!r} belongs to a different sweep."
+                raise ValueError(msg)
+            self._newline = bool(lines) and not content.endswith("\n")
+            if self._newline:
+                lines.pop()  # incomplete line
+            self._completed = {int(line) for line in lines}
+
+    @functools.cached_property
+    def definition(self):
+        """JSON-serialisable definition of the sweep values."""
+        return _sweep_definition(self.values)
+
+    @property
+    def completed(self):
+        """Sorted indices of completed values."""
+        return sorted(self._completed)
+
+    @property
+    def remaining(self):
+        """Indices of values that are not completed."""
+        return [i for i in range(len(self.values)) if i not in self._completed]
+
+    def _write_header(self):
+        tmp = self.journal.with_name(f"{self.journal.name}.tmp")
+        try:
+            with tmp.open("w", encoding="utf-8") as f:
+                f.write(json.dumps({"definition": self.definition}) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.journal)
+        finally:
+            tmp.unlink(missing_ok=True)
+
+    def mark_completed(self, index):
+        """Mark value with ``index`` as completed and update the journal."""
+        if not self.journal.exists():
+            self._write_header()
+        with self.journal.open("a", encoding="utf-8") as f:
+            f.write(("\n" if self._newline else "") + f"{index}\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self._newline = False
+        self._completed.add(index)
+
+    def __iter__(self):
+        for index in self.remaining:
+            yield index, self.values[index]
+            self.mark_completed(index)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.definition}, journal={self.journal!r})"
+
+
+class SweepGrid(collections.abc.Sequence):
+    """Lazy Cartesian product of parameter values.
+
+    Each keyword argument defines one axis of the grid by its values, which can
+    be any sequence supporting ``len`` and indexing (e.g. ``list``,
+    ``numpy.ndarray``, or the result of ``ubermagutil.hysteresis_values``, also
+    with ``output='lazy'``). Grid points are dictionaries mapping axis names to
+    values. They are ordered as in ``itertools.product``, i.e. the last axis
+    varies fastest.
+
+    The grid is never materialised: grid points are computed from their flat
+    index on access and iteration generates them one by one. To distribute the
+    grid to a pool of workers, ``chunks`` splits the flat indices into balanced
+    ranges, which are cheap to send to other processes together with the grid.
+
+    Parameters
+    ----------
+    axes : collections.abc.Sequence
+
+        Values of the axes passed as keyword arguments.
+
+    Raises
+    ------
+    ValueError
+
+        If no axis is passed.
+
+    Examples
+    --------
+    1. Sweep over field and temperature.
+
+    >>> import ubermagutil as uu
+    ...
+    >>> grid = uu.tools.SweepGrid(
+    ...     H=uu.hysteresis_values(-1, 1, 1, output='lazy'), T=[0, 300]
+    ... )
+    >>> len(grid), grid.shape
+    (10, (5, 2))
+    >>> grid[3]
+    {'H': 0.0, 'T': 300}
+    >>> grid.chunks(3)
+    [range(0, 4), range(4, 7), range(7, 10)]
+
+    """
+
+    def __init__(self, **axes):
+        if not axes:
+            raise ValueError("At least one axis is required.")
+        self.axes = axes
+
+    @property
+    def names(self):
+        """Names of the axes."""
+        return tuple(self.axes)
+
+    @property
+    def shape(self):
+        """Number of values along each axis."""
+        return tuple(len(values) for values in self.axes.values())
+
+    def __len__(self):
+        return math.prod(self.shape)
+
+    def __getitem__(self, index):
+        index = operator.index(index)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("Sweep grid index out of range.")
+        point = {}
+        for name, size in zip(reversed(self.names), reversed(self.shape)):
+            index, axis_index = divmod(index, size)
+            point[name] = self.axes[name][axis_index]
+        return {name: point[name] for name in self.names}
+
+    def __iter__(self):
+        for values in itertools.product(*self.axes.values()):
+            yield dict(zip(self.names, values))
+
+    def chunks(self, n):
+        """Split flat indices into ``n`` ranges with sizes differing by at most 1.
+
+        Parameters
+        ----------
+        n : int
+
+            Number of chunks.
+
+        Returns
+        -------
+        list
+
+            ``range`` objects of flat indices. Empty ranges are omitted.
+
+        """
+        if n < 1:
+            raise ValueError(f"Number of chunks {n=} must be positive.")
+        size, rem = divmod(len(self), n)
+        bounds = [i * size + min(i, rem) for i in range(n + 1)]
+        return [range(a, b) for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(names={self.names}, shape={self.shape})"
+
+
+def _unit_vector(vector):
+    vector = np.asarray(vector, dtype=float)
+    if vector.shape != (3,):
+        msg = f"Vector must have shape (3,), not {vector.shape}."
+        raise ValueError(msg)
+    norm = np.linalg.norm(vector)
+    if norm == 0:
+        raise ValueError("Cannot normalise zero vector.")
+    return vector / norm
+
+
+def hysteresis_path(vmin, vmax, step, direction=(0, 0, 1)):
+    """Generate hysteresis field vectors along a direction.
+
+    Field magnitudes are the same as in ``ubermagutil.hysteresis_values`` and
+    all vectors are parallel to ``direction`` (which does not need to be
+    normalised). Minor loops are obtained with ``vmin`` and ``vmax`` not
+    symmetric around zero.
+
+    Parameters
+    ----------
+    vmin : numbers.Real
+
+        Minimum value
+
+    vmax : numbers.Real
+
+        Maximum value
+
+    step : numbers.Real
+
+        Step value
+
+    direction : array_like, optional
+
+        Direction of the field. Defaults to ``(0, 0, 1)``.
+
+    Returns
+    -------
+    numpy.ndarray
+
+        Field vectors with shape ``(N, 3)``.
+
+    Raises
+    ------
+    ValueError
+
+        If ``vmax - vmin`` range cannot be divided into integer number of
+        steps or ``direction`` is not a non-zero three-dimensional vector.
+
+    Examples
+    --------
+    1. Hysteresis along the x direction.
+
+    >>> import ubermagutil as uu
+    ...
+    >>> path = uu.tools.hysteresis_path(-1, 1, 1, direction=(2, 0, 0))
+    >>> path.shape
+    (5, 3)
+    >>> path[:, 0]
+    array([ 1.,  0., -1.,  0.,  1.])
+
+    """
+    values = hysteresis_values(vmin, vmax, step, output="array")
+    return np.multiply.outer(values, _unit_vector(direction))
+
+
+def rotation_path(vector, step, axis=(0, 0, 1), angle=360):
+    """Generate field vectors rotating around an axis.
+
+    ``vector`` is rotated in steps of ``step`` degrees around ``axis`` (right
+    hand rule) until the total rotation ``angle`` is reached. The first and the
+    last vectors correspond to the rotation by ``0`` and ``angle`` degrees,
+    respectively. Components of ``vector`` parallel to ``axis`` are preserved,
+    i.e. vectors not perpendicular to ``axis`` rotate on a cone.
+
+    Parameters
+    ----------
+    vector : array_like
+
+        Initial field vector.
+
+    step : numbers.Real
+
+        Rotation step in degrees.
+
+    axis : array_like, optional
+
+        Rotation axis. Defaults to ``(0, 0, 1)``.
+
+    angle : numbers.Real, optional
+
+        Total rotation angle in degrees. Defaults to ``360``.
+
+    Returns
+    -------
+    numpy.ndarray
+
+        Field vectors with shape ``(N, 3)``.
+
+    Raises
+    ------
+    ValueError
+
+        If ``angle`` cannot be divided into integer number of steps.
+
+    Examples
+    --------
+    1. Rotating field in the xy plane.
+
+    >>> import numpy as np
+    >>> import ubermagutil as uu
+    ...
+    >>> path = uu.tools.rotation_path((1e6, 0, 0), step=90)
+    >>> np.round(path / 1e6, 6) + 0.0
+    array([[ 1.,  0.,  0.],
+           [ 0.,  1.,  0.],
+           [-1.,  0.,  0.],
+           [ 0., -1.,  0.],
+           [ 1.,  0.,  0.]])
+
+    """
+    _check_steps(angle, step)
+    vector = np.asarray(vector, dtype=float)
+    axis = _unit_vector(axis)
+    theta = np.radians(np.linspace(0, angle, round(angle / step) + 1))[:, np.newaxis]
+    parallel = np.dot(axis, vector) * axis
+    return (
+        parallel
+        + np.cos(theta) * (vector - parallel)
+        + np.sin(theta) * np.cross(axis, vector)
+    )
+
+
+def waypoint_path(waypoints, step):
+    """Generate field vectors on straight segments between waypoints.
+
+    Consecutive ``waypoints`` are connected with straight lines sampled with
+    distance ``step`` between neighbouring vectors. All waypoints are part of
+    the result. Every segment length must be divisible into integer number of
+    steps.
+
+    Parameters
+    ----------
+    waypoints : array_like
+
+        Field vectors with shape ``(M, 3)`` the path passes through.
+
+    step : numbers.Real
+
+        Distance between neighbouring vectors.
+
+    Returns
+    -------
+    numpy.ndarray
+
+        Field vectors with shape ``(N, 3)``.
+
+    Raises
+    ------
+    ValueError
+
+        If a segment length cannot be divided into integer number of steps.
+
+    Examples
+    --------
+    1. Triangular path.
+
+    >>> import ubermagutil as uu
+    ...
+    >>> uu.tools.waypoint_path([(0, 0, 0), (2, 0, 0), (2, 0, 1)], step=1)
+    array([[0., 0., 0.],
+           [1., 0., 0.],
+           [2., 0., 0.],
+           [2., 0., 1.]])
+
+    """
+    waypoints = np.asarray(waypoints, dtype=float)
+    if waypoints.ndim != 2 or waypoints.shape[1] != 3 or len(waypoints) == 0:
+        msg = f"Waypoints must have shape (M, 3), not {waypoints.shape}."
         raise ValueError(msg)
 
-    return np.concatenate(
-        [np.arange(vmax, vmin, -step), np.arange(vmin, vmax + rtol * step, step)]
-    ).tolist()
+    segments = np.diff(waypoints, axis=0)
+    lengths = np.linalg.norm(segments, axis=1)
+    for length in lengths:
+        _check_steps(length, step)
+    counts = np.rint(lengths / step).astype(int)
+
+    index = np.repeat(np.arange(len(segments)), counts)
+    # Position within the segment: 0, 1/n, ..., (n-1)/n for every segment.
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    fraction = (offsets / counts[index])[:, np.newaxis]
+    path = waypoints[index] + fraction * segments[index]
+    return np.concatenate([path, waypoints[-1:]])
 
 
 @contextlib.contextmanager
@@ -73,3 +841,255 @@ def changedir(dirname):
         yield
     finally:
         os.chdir(cwd)
+
+
+_workdir = contextvars.ContextVar("workdir", default=None)
+
+
+def current_workdir():
+    """Return the working directory of the current context.
+
+    The directory set with ``ubermagutil.tools.workdir`` for the current
+    context or the process working directory if none was set.
+
+    Returns
+    -------
+    pathlib.Path
+
+        Absolute path of the working directory.
+
+    """
+    dirname = _workdir.get()
+    return pathlib.Path.cwd() if dirname is None else dirname
+
+
+def resolve_path(path):
+    """Resolve ``path`` relative to ``ubermagutil.tools.current_workdir()``.
+
+    Parameters
+    ----------
+    path : str, pathlib.Path
+
+        Path to be resolved. Absolute paths are returned unchanged.
+
+    Returns
+    -------
+    pathlib.Path
+
+        Absolute path.
+
+    """
+    return current_workdir() / path
+
+
+@contextlib.contextmanager
+def workdir(dirname):
+    """Context manager for changing directory without changing process state.
+
+    Unlike ``ubermagutil.changedir``, ``os.chdir`` is not called. Instead, the
+    directory is stored in a context variable, which is local to the current
+    thread and ``asyncio`` task. Code running inside the context obtains the
+    directory with ``ubermagutil.tools.current_workdir`` (e.g. to pass it as
+    ``cwd`` to ``subprocess.run``) and resolves relative paths with
+    ``ubermagutil.tools.resolve_path``. This allows running multiple
+    simulations in different directories concurrently within one process.
+
+    Relative ``dirname`` is interpreted relative to the working directory of
+    the current context, so contexts can be nested. New threads do not inherit
+    the context; use ``contextvars.copy_context().run`` to propagate it.
+
+    Parameters
+    ----------
+    dirname : str, pathlib.Path
+
+        Working directory.
+
+    Yields
+    ------
+    pathlib.Path
+
+        Absolute path of the working directory.
+
+    Examples
+    --------
+    1. Setting the working directory of the current context.
+
+    >>> import os
+    >>> import tempfile
+    >>> import ubermagutil as uu
+    ...
+    >>> tmpdir = tempfile.mkdtemp()
+    >>> cwd = os.getcwd()
+    >>> with uu.tools.workdir(tmpdir) as path:
+    ...     uu.tools.resolve_path('test.txt') == path / 'test.txt'
+    True
+    >>> os.getcwd() == cwd
+    True
+
+    """
+    path = resolve_path(dirname)
+    token = _workdir.set(path)
+    try:
+        yield path
+    finally:
+        _workdir.reset(token)
+
+
+def _scratch_root():
+    """Default location for scratch directories."""
+    if "UBERMAG_SCRATCH" in os.environ:
+        return os.environ["UBERMAG_SCRATCH"]
+    elif os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK):
+        return "/dev/shm"
+    else:
+        return tempfile.gettempdir()
+
+
+def _copy_matching(source, destination, patterns, threads):
+    """Copy files matching glob ``patterns`` from ``source`` to ``destination``."""
+    files = {
+        path
+        for pattern in patterns
+        for path in pathlib.Path(source).glob(pattern)
+        if path.is_file()
+    }
+
+    def copy(path):
+        target = pathlib.Path(destination) / path.relative_to(source)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copy2(path, target)  # streamed, uses sendfile where available
+
+    if threads > 1 and len(files) > 1:
+        with concurrent.futures.ThreadPoolExecutor(threads) as executor:
+            list(executor.map(copy, files))
+    else:
+        for path in files:
+            copy(path)
+    return len(files)
+
+
+@contextlib.contextmanager
+def scratchdir(
+    dirname,
+    patterns=("**/*",),
+    copy_in=(),
+    scratch_root=None,
+    max_size=None,
+    threads=1,
+    chdir=True,
+):
+    """Context manager for running in a scratch directory on a fast filesystem.
+
+    A temporary directory is created in ``scratch_root``, which should be on a
+    fast local filesystem such as the RAM-backed ``/dev/shm``. Inside the
+    context, the working directory is the scratch directory, so that
+    intermediate files are not written to a slow or network filesystem. On
+    exit, including exits with an exception, files matching the glob
+    ``patterns`` (relative to the scratch directory, ``**`` is supported) are
+    copied to ``dirname`` and the scratch directory is removed. If copying the
+    results fails (e.g. because ``dirname`` is full), the scratch directory is
+    kept and its path is logged.
+
+    If ``max_size`` is passed and the scratch filesystem does not have at least
+    ``max_size`` bytes free, or if the scratch directory cannot be created,
+    ``dirname`` is used directly (as in ``ubermagutil.changedir``).
+
+    Parameters
+    ----------
+    dirname : str, pathlib.Path
+
+        Destination directory. It is created if it does not exist.
+
+    patterns : collections.abc.Iterable, optional
+
+        Glob patterns of files copied to ``dirname`` on exit. Defaults to
+        ``('**/*',)`` (all files including subdirectories).
+
+    copy_in : collections.abc.Iterable, optional
+
+        Glob patterns of files copied from ``dirname`` to the scratch directory
+        on entry. Defaults to ``()``.
+
+    scratch_root : str, pathlib.Path, optional
+
+        Directory in which the scratch directory is created. Defaults to the
+        environment variable ``UBERMAG_SCRATCH`` if set, otherwise to
+        ``/dev/shm`` if available and to the system temporary directory if
+        not.
+
+    max_size : int, optional
+
+        Required free space on the scratch filesystem in bytes. Defaults to
+        ``None``.
+
+    threads : int, optional
+
+        Number of threads used for copying files. Defaults to ``1``.
+
+    chdir : bool, optional
+
+        If ``True``, the process working directory is changed (as in
+        ``ubermagutil.changedir``). Otherwise, only the working directory of
+        the current context is changed (as in ``ubermagutil.tools.workdir``).
+        Defaults to ``True``.
+
+    Yields
+    ------
+    pathlib.Path
+
+        Path of the directory in use (scratch directory or ``dirname``).
+
+    Examples
+    --------
+    1. Keep only ``.odt`` files.
+
+    >>> import os
+    >>> import tempfile
+    >>> import ubermagutil as uu
+    ...
+    >>> destination = tempfile.mkdtemp()
+    >>> with uu.tools.scratchdir(destination, patterns=['*.odt']):
+    ...     for name in ['sim.odt', 'sim.log']:
+    ...         with open(name, 'w') as f:
+    ...             _ = f.write('')
+    >>> os.listdir(destination)
+    ['sim.odt']
+
+    """
+    destination = resolve_path(dirname)
+    destination.mkdir(parents=True, exist_ok=True)
+    scratch_root = _scratch_root() if scratch_root is None else scratch_root
+    context = changedir if chdir else workdir
+
+    try:
+        if max_size is not None and shutil.disk_usage(scratch_root).free < max_size:
+            raise OSError(f"Less than {max_size} bytes free in {scratch_root!r}.")
+        scratch = pathlib.Path(tempfile.mkdtemp(prefix="ubermag-", dir=scratch_root))
+    except OSError as e:
+        log.warning("Cannot use scratch directory (%s), using %s.", e, destination)
+        scratch = None
+
+    if scratch is None:
+        with context(destination):
+            yield destination
+        return
+
+    keep = False
+    try:
+        _copy_matching(destination, scratch, copy_in, threads)
+        try:
+            with context(scratch):
+                yield scratch
+        finally:
+            try:
+                n = _copy_matching(scratch, destination, patterns, threads)
+            except OSError:
+                keep = True  # the scratch directory has the only copy
+                log.error(
+                    "Cannot copy results to %s, keeping %s.", destination, scratch
+                )
+                raise
+            log.debug("Copied %d files from %s to %s.", n, scratch, destination)
+    finally:
+        if not keep:
+            shutil.rmtree(scratch, ignore_errors=True)
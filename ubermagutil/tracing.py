@@ -0,0 +1,328 @@
+"""Hierarchical timing spans with Chrome trace-event export.
+
+Spans are recorded only while tracing is enabled with ``enable`` or by setting
+the environment variable ``UBERMAG_TRACE`` to the path of a trace file, which is
+written when the interpreter exits. While disabled, ``span`` returns a shared
+no-op context manager and ``traced`` functions only check a flag.
+
+"""
+
+import asyncio
+import atexit
+import collections
+import contextvars
+import functools
+import inspect
+import itertools
+import json
+import os
+import threading
+import time
+import weakref
+
+_enabled = False
+_lock = threading.Lock()
+_spans = []  # (path, start, duration, tid, args) with times in ns
+_tracks = {}  # tid -> name
+_tids = itertools.count(1)  # thread idents and ids of tasks are reused
+_thread_tids = threading.local()
+_task_tids = weakref.WeakKeyDictionary()
+_current = contextvars.ContextVar("ubermagutil_span", default=None)
+_origin = time.perf_counter_ns()
+
+
+def enable():
+    """Start recording spans."""
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    """Stop recording spans. Recorded spans are kept."""
+    global _enabled
+    _enabled = False
+
+
+def is_enabled():
+    """``True`` if spans are recorded."""
+    return _enabled
+
+
+def clear():
+    """Remove all recorded spans."""
+    with _lock:
+        _spans.clear()
+        _tracks.clear()
+
+
+def _track():
+    """Id and name of the thread or asyncio task running the current span."""
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:  # no running event loop
+        task = None
+    thread = threading.current_thread()
+    if task is None:
+        tid = getattr(_thread_tids, "tid", None)
+        if tid is None:
+            tid = _thread_tids.tid = next(_tids)
+        return tid, thread.name
+    with _lock:
+        tid = _task_tids.get(task)
+        if tid is None:
+            tid = _task_tids[task] = next(_tids)
+    return tid, f"{thread.name} ({task.get_name()})"
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("name", "args", "path", "_start", "_token")
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        parent = _current.get()
+        self.path = (self.name,) if parent is None else (*parent.path, self.name)
+        self._token = _current.set(self)
+        self._start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        end = time.perf_counter_ns()
+        _current.reset(self._token)
+        args = self.args
+        if exc_type is not None:
+            args = {**args, "error": exc_type.__name__}
+        tid, track_name = _track()
+        with _lock:
+            _spans.append((self.path, self._start, end - self._start, tid, args))
+            _tracks.setdefault(tid, track_name)
+        return False
+
+
+def span(name, **args):
+    """Context manager recording a timing span.
+
+    Spans opened inside another span (in the same thread, or in an asyncio task
+    created inside it) are recorded as its children.
+
+    Parameters
+    ----------
+    name : str
+
+        Name of the span.
+
+    args
+
+        JSON serialisable values stored with the span and shown in the trace
+        viewer.
+
+    Examples
+    --------
+    1. Nested spans.
+
+    >>> import ubermagutil.tracing as ut
+    ...
+    >>> ut.clear()
+    >>> ut.enable()
+    >>> with ut.span('drive'):
+    ...     with ut.span('write input'):
+    ...         pass
+    ...     with ut.span('run', solver='rk4'):
+    ...         pass
+    >>> ut.disable()
+    >>> [event['name'] for event in ut.chrome_trace()['traceEvents']
+    ...  if event['ph'] == 'X']
+    ['write input', 'run', 'drive']
+
+    """
+    if not _enabled:
+        return _NULL_SPAN
+    return _Span(name, args)
+
+
+def traced(func=None, *, name=None):
+    """Decorator recording every call of a function as a span.
+
+    Coroutine functions are supported. The decorated function only checks
+    whether tracing is enabled when it is called, so functions can be decorated
+    at import time.
+
+    Parameters
+    ----------
+    func : callable
+
+        Function to trace.
+
+    name : str, optional
+
+        Name of the span. Defaults to the qualified name of the function.
+
+    Examples
+    --------
+    1. Tracing a function.
+
+    >>> import ubermagutil.tracing as ut
+    ...
+    >>> @ut.traced
+    ... def setup():
+    ...     pass
+    >>> @ut.traced(name='solver')
+    ... def run():
+    ...     setup()
+    ...
+    >>> ut.clear()
+    >>> ut.enable()
+    >>> run()
+    >>> ut.disable()
+    >>> print(ut.report())
+    span                      calls     total (s)      mean (s)       max (s)
+    solver                        1...
+      setup                       1...
+
+    """
+    if func is None:
+        return functools.partial(traced, name=name)
+    name = func.__qualname__ if name is None else name
+
+    if inspect.iscoroutinefunction(func):
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            if not _enabled:
+                return await func(*args, **kwargs)
+            with _Span(name, {}):
+                return await func(*args, **kwargs)
+
+    else:
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _Span(name, {}):
+                return func(*args, **kwargs)
+
+    return wrapper
+
+
+def chrome_trace():
+    """Recorded spans in the Chrome trace-event format.
+
+    Every span is a complete (``'X'``) event. Each thread and each asyncio task
+    is shown as a separate track, so that concurrent spans do not overlap. The
+    result can be opened in ``chrome://tracing`` or https://ui.perfetto.dev
+    after writing it with ``write_chrome_trace``.
+
+    Returns
+    -------
+    dict
+
+        Trace with the list of events under ``'traceEvents'``.
+
+    """
+    pid = os.getpid()
+    with _lock:
+        spans = list(_spans)
+        tracks = dict(_tracks)
+    events = [
+        {"name": "process_name", "ph": "M", "pid": pid, "args": {"name": "ubermag"}}
+    ]
+    events.extend(
+        {"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": n}}
+        for tid, n in tracks.items()
+    )
+    events.extend(
+        {
+            "name": path[-1],
+            "cat": "ubermag",
+            "ph": "X",
+            "ts": (start - _origin) / 1e3,
+            "dur": duration / 1e3,
+            "pid": pid,
+            "tid": tid,
+            "args": args,
+        }
+        for path, start, duration, tid, args in spans
+    )
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def write_chrome_trace(path):
+    """Write recorded spans to a Chrome trace-event JSON file.
+
+    Parameters
+    ----------
+    path : str
+
+        Path of the JSON file.
+
+    """
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(chrome_trace(), f, default=str)
+
+
+def report():
+    """Aggregated text report of the recorded spans.
+
+    Spans with the same name and the same parents are aggregated into one line
+    showing the number of calls and the total, mean, and maximum duration.
+    Children are indented below their parent.
+
+    Returns
+    -------
+    str
+
+        Report table.
+
+    """
+    with _lock:
+        spans = list(_spans)
+    stats = collections.defaultdict(list)
+    for path, _, duration, _, _ in spans:
+        for i in range(1, len(path)):
+            stats[path[:i]]  # parents which are still open have no durations
+        stats[path].append(duration / 1e9)
+
+    lines = [
+        f"{'span':<20}{'calls':>11}{'total (s)':>14}{'mean (s)':>14}{'max (s)':>14}"
+    ]
+
+    def add(parent):
+        children = sorted(
+            (path for path in stats if path[:-1] == parent),
+            key=lambda path: -sum(stats[path]),
+        )
+        for path in children:
+            durations = stats[path]
+            label = "  " * (len(path) - 1) + path[-1]
+            line = f"{label:<25}{len(durations):>6}"
+            if durations:
+                line += (
+                    f"{sum(durations):>14.3f}"
+                    f"{sum(durations) / len(durations):>14.3f}{max(durations):>14.3f}"
+                )
+            lines.append(line)
+            add(path)
+
+    add(())
+    return "\n".join(lines)
+
+
+if os.environ.get("UBERMAG_TRACE"):
+    enable()
+    atexit.register(write_chrome_trace, os.environ["UBERMAG_TRACE"])
@@ -1,6 +1,10 @@
 """SI multiplier utility."""
 
+from .units import SIScaledView as SIScaledView
 from .units import rsi_prefixes as rsi_prefixes
+from .units import si_format as si_format
 from .units import si_max_multiplier as si_max_multiplier
 from .units import si_multiplier as si_multiplier
+from .units import si_parse as si_parse
 from .units import si_prefixes as si_prefixes
+from .units import si_rescale as si_rescale
@@ -1,6 +1,10 @@
 """SI multiplier utility."""
 
 import collections
+import functools
+import re
+
+import numpy as np
 
 si_prefixes = collections.OrderedDict(
     {
@@ -108,3 +112,471 @@ def si_max_multiplier(values):
 
     """
     return max(list(map(si_multiplier, values)))
+
+
+_si_multipliers = np.array(list(si_prefixes.values()), dtype=float)
+_si_exponent_range = np.array([round(np.log10(m)) for m in si_prefixes.values()])
+
+
+def _si_exponents(values):
+    """Vectorised SI exponents consistent with ``si_multiplier``.
+
+    Values outside the range covered by ``si_prefixes`` are clipped to the
+    smallest or largest available exponent. Zeros and non-finite values get
+    exponent ``0``.
+
+    """
+    values = np.abs(np.asarray(values, dtype=float))
+    nonzero = np.isfinite(values) & (values != 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        exponents = 3 * np.floor(np.log10(np.where(nonzero, values, 1)) / 3)
+        # Correct for rounding errors of log10 close to powers of 1000.
+        scaled = values / 10.0**exponents
+    exponents = np.where(scaled >= 1e3, exponents + 3, exponents)
+    exponents = np.where(scaled < 1, exponents - 3, exponents)
+    exponents = np.where(nonzero, exponents, 0)
+    return np.clip(exponents, _si_exponent_range[0], _si_exponent_range[-1]).astype(int)
+
+
+@functools.lru_cache(maxsize=128)
+def _si_suffixes(unit):
+    """Cached array of ``" <prefix><unit>"`` strings ordered as ``si_prefixes``."""
+    return np.array(
+        [f" {prefix}{unit}" if prefix or unit else "" for prefix in si_prefixes]
+    )
+
+
+@functools.lru_cache(maxsize=32)
+def _format_template(precision):
+    """Cached newline-terminated ``%``-style template for ``precision`` digits."""
+    return f"%.{precision}f\n"
+
+
+def _format_fixed(values, precision):
+    """Format all values with a single ``%`` operation instead of one per value."""
+    flat = values.ravel().tolist()
+    text = (_format_template(precision) * len(flat)) % tuple(flat)
+    return np.array(text.split("\n")[:-1], dtype=str).reshape(values.shape)
+
+
+def si_format(values, unit="", shared=True, precision=1):
+    """Format values as strings with SI prefixes.
+
+    Values are divided by their SI multiplier, formatted with ``precision``
+    decimal places and the matching SI prefix followed by ``unit`` is
+    appended. If ``shared=True``, a single multiplier computed as in
+    ``ubermagutil.units.si_max_multiplier`` is used for all values (e.g. for
+    columns of a table or tick labels). Otherwise, a multiplier is computed for
+    every value separately as in ``ubermagutil.units.si_multiplier``. Values
+    outside the range of ``si_prefixes`` use the smallest or largest available
+    prefix.
+
+    Parameters
+    ----------
+    values : numbers.Real, array_like
+
+        Values to be formatted.
+
+    unit : str, optional
+
+        Unit appended after the SI prefix. Defaults to ``''``.
+
+    shared : bool, optional
+
+        If ``True``, all values share the same SI prefix. Defaults to ``True``.
+
+    precision : int, optional
+
+        Number of decimal places. Defaults to ``1``.
+
+    Returns
+    -------
+    str, numpy.ndarray
+
+        Formatted string if ``values`` is a scalar, otherwise an array of
+        strings with the same shape as ``values``.
+
+    Examples
+    --------
+    1. Format values with a shared and with individual SI prefixes.
+
+    >>> import ubermagutil.units as uu
+    ...
+    >>> uu.si_format(5e-9, 'm')
+    '5.0 nm'
+    >>> uu.si_format([5e-9, 50e-9, 5000e-9], 'm').tolist()
+    ['0.0 um', '0.1 um', '5.0 um']
+    >>> uu.si_format([5e-9, 50e-9, 5000e-9], 'm', shared=False).tolist()
+    ['5.0 nm', '50.0 nm', '5.0 um']
+    >>> uu.si_format([0.25, 1.5], 'T', precision=2).tolist()
+    ['0.25 T', '1.50 T']
+
+    .. seealso:: :py:class:`~ubermagutil.units.si_max_multiplier`
+
+    """
+    array = np.asarray(values, dtype=float)
+    exponents = _si_exponents(array)
+    if shared and array.size > 0:
+        exponents = np.full_like(exponents, exponents.max())
+
+    index = (exponents - _si_exponent_range[0]) // 3
+    scaled = array / _si_multipliers[index]
+    result = np.char.add(_format_fixed(scaled, precision), _si_suffixes(unit)[index])
+    return str(result) if result.ndim == 0 else result
+
+
+_quantity_regex = re.compile(
+    r"[ \t]*([+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)[ \t]*(\S*)[ \t]*"
+)
+
+
+# Units (or the first factor of compound units, e.g. ``A`` in ``A/m``) for which
+# the SI prefix can be split off without passing ``unit`` to ``si_parse``.
+_known_units = frozenset(
+    [
+        "m",
+        "g",
+        "s",
+        "A",
+        "K",
+        "mol",
+        "cd",
+        "Hz",
+        "N",
+        "Pa",
+        "J",
+        "W",
+        "C",
+        "V",
+        "F",
+        "Ohm",
+        "ohm",
+        "S",
+        "Wb",
+        "T",
+        "H",
+        "eV",
+        "rad",
+        "sr",
+        "deg",
+        "min",
+        "h",
+        "B",
+        "Oe",
+        "G",
+        "emu",
+        "erg",
+    ]
+)
+_unit_head_regex = re.compile(r"[^/*·^\d\s.-]*")
+
+
+@functools.lru_cache(maxsize=1024)
+def _split_prefix(token, unit):
+    """Split ``token`` into SI multiplier and unit.
+
+    If ``unit`` is ``None``, the first character of ``token`` is interpreted as
+    an SI prefix only if the rest of the (first factor of the) unit is a known
+    unit, so that e.g. ``'m'`` is metre, ``'mT'`` is millitesla, and ``'Pa'``
+    is pascal. Tokens starting with a prefix character which are neither a
+    known unit nor a prefixed known unit are ambiguous and raise
+    ``ValueError``.
+
+    """
+    token = token.replace("µ", "u").replace("μ", "u")  # micro sign, greek mu
+    if unit is not None:
+        prefix = token[: len(token) - len(unit)]
+        if not token.endswith(unit) or prefix not in si_prefixes:
+            msg = f"Cannot interpret {token!r} as an SI-prefixed {unit!r}."
+            raise ValueError(msg)
+        return si_prefixes[prefix], unit
+    head = _unit_head_regex.match(token).group()
+    if head in _known_units or not head[:1] or head[0] not in si_prefixes:
+        return 1, token
+    if head[1:] in _known_units:
+        return si_prefixes[head[0]], token[1:]
+    msg = (
+        f"Cannot determine whether {token!r} starts with an SI prefix; pass the"
+        " expected unit with unit=..."
+    )
+    raise ValueError(msg)
+
+
+def _scale(values, multipliers):
+    """Multiply by SI multipliers, dividing by exact powers of ten for m < 1.
+
+    Dividing e.g. by ``1e9`` instead of multiplying by the inexact ``1e-9``
+    gives the correctly rounded result (``3 ns`` becomes ``3e-9``).
+
+    """
+    multipliers = np.asarray(multipliers, dtype=float)
+    large = multipliers >= 1
+    return (
+        values
+        * np.where(large, multipliers, 1)
+        / np.where(large, 1, np.round(1 / multipliers))
+    )
+
+
+def _match_quantity(quantity):
+    """Number and (prefixed) unit of ``quantity`` matched with a regex."""
+    match = _quantity_regex.fullmatch(quantity)
+    if match is None:
+        msg = f"Cannot parse {quantity!r} as an SI quantity."
+        raise ValueError(msg)
+    return match.groups()
+
+
+def si_parse(quantities, unit=None):
+    """Parse strings of SI-prefixed quantities.
+
+    Every string must consist of a number, optionally followed by an SI prefix
+    (a key of ``si_prefixes``) and a unit, e.g. ``'250 mT'``, ``'5e-9 m'`` or
+    ``'3 ns'``. If ``unit`` is not passed, a leading prefix character is only
+    split off when the rest is a known unit, so ``'5 m'`` is five metres and
+    ``'100 Pa'`` is 100 pascal. Units which are neither known nor start with a
+    prefix character (e.g. ``'1 Xyz'``) are kept as they are, and unknown units
+    starting with a prefix character (e.g. ``'2 mXyz'``) raise ``ValueError``.
+    Passing ``unit`` removes this ambiguity.
+
+    A single string returns a ``(float, str)`` tuple. Any other iterable of
+    strings returns a tuple of two numpy arrays (values and units) with the
+    shape of ``quantities``. It is parsed with numpy string operations: numbers
+    are split from units at the first space and converted with ``astype``, and
+    the prefix of each distinct unit is resolved once. Only if this fails (e.g.
+    for ``'3ns'`` without a space, or invalid strings), every string is matched
+    with a regular expression.
+
+    Parameters
+    ----------
+    quantities : str, array_like of str
+
+        Quantities to be parsed.
+
+    unit : str, optional
+
+        Expected unit (without prefix). Defaults to ``None``.
+
+    Returns
+    -------
+    tuple
+
+        Values in base (unprefixed) units and the corresponding units.
+
+    Raises
+    ------
+    ValueError
+
+        If a string cannot be parsed or its SI prefix is ambiguous.
+
+    Examples
+    --------
+    1. Parse SI-prefixed quantities.
+
+    >>> import ubermagutil.units as uu
+    ...
+    >>> uu.si_parse('250 mT')
+    (0.25, 'T')
+    >>> values, units = uu.si_parse(['5e-9 m', '3 ns', '1.5 kA/m'])
+    >>> values.tolist()
+    [5e-09, 3e-09, 1500.0]
+    >>> units.tolist()
+    ['m', 's', 'A/m']
+    >>> uu.si_parse(['5 mol', '2 kmol'], unit='mol')[0]
+    array([   5., 2000.])
+
+    .. seealso:: :py:class:`~ubermagutil.units.si_format`
+
+    """
+    if isinstance(quantities, str):
+        number, token = _match_quantity(quantities)
+        multiplier, parsed_unit = _split_prefix(token, unit)
+        return float(_scale(float(number), multiplier)), parsed_unit
+
+    if not isinstance(quantities, np.ndarray):
+        quantities = list(quantities)  # iterables and generators
+    array = np.asarray(quantities, dtype=str)
+    if array.size == 0:
+        return np.zeros(array.shape), np.zeros(array.shape, dtype=str)
+
+    flat = np.char.strip(array.ravel(), " \t")
+    numbers, _, tokens = np.char.partition(flat, " ").T
+    tokens = np.char.lstrip(tokens, " \t")
+    # Numbers may only contain these characters (astype also accepts e.g. 'nan'),
+    # units no whitespace.
+    valid = np.char.strip(numbers, "0123456789+-.eE") == ""
+    for char in " \t\n\r\f\v":
+        valid &= np.char.find(tokens, char) < 0
+    try:
+        if not valid.all():
+            raise ValueError
+        numbers = numbers.astype(float)
+    except ValueError:
+        numbers, tokens = map(np.array, zip(*map(_match_quantity, flat.tolist())))
+        numbers = numbers.astype(float)
+
+    # Prefixes and units are resolved once per distinct token.
+    unique_tokens, inverse = np.unique(tokens, return_inverse=True)
+    multipliers, units = zip(*(_split_prefix(t, unit) for t in unique_tokens))
+    values = _scale(numbers, np.array(multipliers)[inverse])
+    return (
+        values.reshape(array.shape),
+        np.array(units, dtype=str)[inverse].reshape(array.shape),
+    )
+
+
+def _array_max_multiplier(array):
+    """Maximum SI multiplier of ``array`` without allocating a temporary copy."""
+    if array.size == 0:
+        return 1
+    largest = max(abs(float(np.max(array))), abs(float(np.min(array))))
+    index = (int(_si_exponents(largest)) - _si_exponent_range[0]) // 3
+    return list(si_prefixes.values())[index]
+
+
+def si_rescale(values, out=None, multiplier=None):
+    """Rescale an array into SI-prefixed display units.
+
+    ``values`` is divided by ``multiplier``. If ``multiplier`` is not passed, it
+    is computed as in ``ubermagutil.units.si_max_multiplier`` (but without
+    iterating over the values in Python). To avoid allocating a new array, the
+    result can be written into a caller-provided buffer ``out`` or into
+    ``values`` itself by passing ``out=values``.
+
+    Parameters
+    ----------
+    values : array_like
+
+        Values to be rescaled.
+
+    out : numpy.ndarray, optional
+
+        Array into which the result is written. It must have the same shape as
+        ``values`` and a floating point ``dtype``. Defaults to ``None``.
+
+    multiplier : numbers.Real, optional
+
+        Multiplier used for rescaling. Defaults to ``None``.
+
+    Returns
+    -------
+    tuple
+
+        Rescaled array (``out`` if passed) and the multiplier.
+
+    Examples
+    --------
+    1. Rescale an array in place.
+
+    >>> import numpy as np
+    >>> import ubermagutil.units as uu
+    ...
+    >>> values = np.array([5e-9, 50e-9, 500e-9])
+    >>> rescaled, multiplier = uu.si_rescale(values, out=values)
+    >>> rescaled is values
+    True
+    >>> multiplier, uu.rsi_prefixes[multiplier]
+    (1e-09, 'n')
+    >>> np.allclose(values, [5, 50, 500])
+    True
+
+    .. seealso:: :py:class:`~ubermagutil.units.SIScaledView`
+
+    """
+    array = np.asanyarray(values)
+    if multiplier is None:
+        multiplier = _array_max_multiplier(array)
+    return np.divide(array, multiplier, out=out), multiplier
+
+
+class SIScaledView:
+    """Lazy view of an array in SI-prefixed display units.
+
+    The underlying array is not copied. Division by ``multiplier`` is applied
+    only to the elements accessed by indexing, which allows plotting or
+    exporting parts of very large arrays without duplicating them in memory.
+    Converting the view to an array (e.g. ``np.asarray(view)``) creates the
+    full rescaled copy.
+
+    Parameters
+    ----------
+    values : array_like
+
+        Array to be viewed.
+
+    unit : str, optional
+
+        Unit of ``values`` (without prefix). Defaults to ``''``.
+
+    multiplier : numbers.Real, optional
+
+        Multiplier used for rescaling. If not passed, it is computed as in
+        ``ubermagutil.units.si_rescale``. Defaults to ``None``.
+
+    Examples
+    --------
+    1. Lazily rescale an array.
+
+    >>> import numpy as np
+    >>> import ubermagutil.units as uu
+    ...
+    >>> view = uu.SIScaledView(np.linspace(0, 100e-9, 11), unit='m')
+    >>> view.label
+    'nm'
+    >>> view[1:4]
+    array([10., 20., 30.])
+    >>> len(view), view.shape
+    (11, (11,))
+
+    """
+
+    def __init__(self, values, unit="", multiplier=None):
+        self.values = np.asanyarray(values)
+        self.unit = unit
+        if multiplier is None:
+            multiplier = _array_max_multiplier(self.values)
+        self.multiplier = multiplier
+
+    @property
+    def prefix(self):
+        """SI prefix corresponding to ``multiplier``."""
+        return rsi_prefixes[self.multiplier]
+
+    @property
+    def label(self):
+        """Prefixed unit, e.g. ``'nm'``."""
+        return f"{self.prefix}{self.unit}"
+
+    @property
+    def shape(self):
+        """Shape of the underlying array."""
+        return self.values.shape
+
+    @property
+    def ndim(self):
+        """Number of dimensions of the underlying array."""
+        return self.values.ndim
+
+    @property
+    def dtype(self):
+        """Data type of the rescaled values."""
+        return np.result_type(self.values.dtype, float)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, key):
+        return self.values[key] / self.multiplier
+
+    def __iter__(self):
+        for item in self.values:
+            yield item / self.multiplier
+
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray(self.values / self.multiplier, dtype=dtype)
+
+    def __repr__(self):
+        return (
+            f"{self.__class__.__name__}(shape={self.shape}, unit={self.unit!r}, "
+            f"multiplier={self.multiplier})"
+        )